@@ -33,6 +33,7 @@ import random
 import game
 import util
 import sys
+import transitionModel
 
 #
 # A class that creates a grid that can be used as a map
@@ -113,13 +114,11 @@ class MDPAgent(Agent):
     def registerInitialState(self, state):
         print "Running registerInitialState!"
         self.map = self.makeMap(state)
-        self.walls = api.walls(state)
+        # Transition model for this layout, shared between games
+        self.model = transitionModel.getTransitionModel(state)
+        self.walls = self.model.walls
         # print self.walls
-        self.nonWalls = []
-        for i in range(self.map.getWidth()):
-            for j in range(self.map.getHeight()):
-                if (i, j) not in self.walls:
-                    self.nonWalls.append((i, j))
+        self.nonWalls = self.model.cells
         # print self.nonWalls
         self.values = dict.fromkeys(self.nonWalls, 0)
         # print self.values
@@ -181,21 +180,8 @@ class MDPAgent(Agent):
             self.policy[i] = "North"
 
     def expectedUtility(self, x, y, action):
-        currentLoc = (x,y);     currentValue = self.values[currentLoc]
         # If move results to a wall, stay in original position
-        northLoc = (x, y + 1);  northValue = self.values[northLoc] if northLoc not in self.walls else currentValue
-        eastLoc = (x + 1, y);   eastValue = self.values[eastLoc] if eastLoc not in self.walls else currentValue
-        southLoc = (x, y - 1);  southValue = self.values[southLoc] if southLoc not in self.walls else currentValue
-        westLoc = (x - 1, y);   westValue = self.values[westLoc] if westLoc not in self.walls else currentValue
-
-        if action == 'North':
-            return 0.8*northValue + 0.1*eastValue + 0.1*westValue
-        elif action == 'East':
-            return 0.8*eastValue + 0.1*northValue + 0.1*southValue
-        elif action == 'South':
-            return 0.8*southValue + 0.1*eastValue + 0.1*westValue
-        else:
-            return 0.8*westValue + 0.1*northValue + 0.1*southValue
+        return self.model.expectedUtility(self.values, (x, y), action)
 
     def argmax(self, utils):
         i = utils.index(max(utils))
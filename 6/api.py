@@ -32,6 +32,7 @@
 
 from random import random
 from pacman import Directions
+from game import Actions
 import util
 
 #
@@ -58,6 +59,20 @@ nonDeterministic = True
 # Probability that Pacman carries out the intended action:
 directionProb = 0.8
 
+#
+# Caches
+#
+
+# Walls never change during a game, so the list and set of wall
+# positions are worked out once for each layout, keyed by layout hash.
+WALL_CACHE = {}
+
+# The food list last handed out, and the food grid bits it was made
+# from. Between two moves food only ever gets eaten, so the next list
+# can be made by removing the eaten food from this one.
+lastFoodBits = None
+lastFoodList = None
+
 # 
 # Sensing
 #
@@ -151,17 +166,28 @@ def food(state):
     #
     # In both cases, walls block the view.
     
-    foodList= []
+    # The food grid can list its food without scanning every location,
+    # and does so in the same column by column order. If the food is a
+    # subset of the food last listed, just the eaten food is removed
+    # from that list instead.
+    global lastFoodBits, lastFoodList
     foodGrid = state.getFood()
-    width = foodGrid.width
-    height = foodGrid.height
-    for i in range(width):
-        for j in range(height):
-            if foodGrid[i][j] == True:
-                foodList.append((i, j))
+    bits = foodGrid.bits
+    if lastFoodList is not None and lastFoodBits[1] == foodGrid.height \
+       and bits & ~lastFoodBits[0] == 0:
+        eaten = lastFoodBits[0] ^ bits
+        if eaten:
+            foodList = [f for f in lastFoodList if not eaten >> (f[0] * foodGrid.height + f[1]) & 1]
+        else:
+            foodList = lastFoodList
+    else:
+        foodList = foodGrid.asList()
+    lastFoodBits = (bits, foodGrid.height)
+    lastFoodList = foodList
             
-    # Return list of food that is visible
-    return foodList
+    # Return list of food that is visible. It is a copy, so that
+    # callers are free to change it.
+    return list(foodList)
 
 def walls(state):
     # Returns a list of (x, y) pairs of wall positions
@@ -169,16 +195,17 @@ def walls(state):
     # This version just returns all the current wall locations
     # extracted from the state data.  In later versions, this will be
     # restricted by distance, and include some uncertainty.
+    #
+    # The list is a copy of the cached one, so callers are free to
+    # change it.
     
-    wallList= []
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    for i in range(width):
-        for j in range(height):
-            if wallGrid[i][j] == True:
-                wallList.append((i, j))            
-    return wallList
+    return list(wallData(state)[0])
+
+def wallSet(state):
+    # Returns the positions of the walls as a frozenset, for checking
+    # whether a position is a wall without searching the list.
+
+    return wallData(state)[1]
 
 def corners(state):
     # Returns the coordinates of the four corners of the state space.
@@ -244,6 +271,25 @@ def makeMove(direction, legal):
 # Details that you don't need to look at if you don't want to.
 #
 
+def wallData(state):
+    # Returns the list (in column by column order) and the set of wall
+    # positions of the layout of state, working them out the first time
+    # the layout is seen.
+
+    layout = state.data.layout
+    key = layout.getContentHash()
+    if key not in WALL_CACHE:
+        wallList = state.getWalls().asList()
+        WALL_CACHE[key] = (tuple(wallList), frozenset(wallList))
+    return WALL_CACHE[key]
+
+def corridorExtent(state, position, direction):
+    # Returns how many locations there are in a straight line from
+    # position in the given direction before a wall, using the
+    # visibility index of the layout (see layout.py).
+
+    return state.data.layout.getVisibilityIndex().getExtent(position, direction)
+
 def distanceLimited(objects, state, limit):
     # When passed a list of object locations, tests how far they are
     # from Pacman, and only returns the ones that are within "limit".
@@ -261,59 +307,37 @@ def inFront(object, facing, state):
     # Returns true if the object is along the corridor in the
     # direction of the parameter "facing" before a wall gets in the
     # way.
+    #
+    # Rather than stepping along the corridor, this works out how many
+    # steps away the object is and compares that with the length of
+    # the corridor.
     
     pacman = state.getPacmanPosition()
     pacman_x = pacman[0]
     pacman_y = pacman[1]
-    wallList = walls(state)
 
-    # If Pacman is facing North
+    # How many steps the object is along the direction Pacman is
+    # facing, and whether it is in line with Pacman at all.
     if facing == Directions.NORTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y + 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] + 1)
-        return False
-
-    # If Pacman is facing South
-    if facing == Directions.SOUTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y - 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] - 1)
+        steps = object[1] - pacman_y
+        inLine = object[0] == pacman_x
+    elif facing == Directions.SOUTH:
+        steps = pacman_y - object[1]
+        inLine = object[0] == pacman_x
+    elif facing == Directions.EAST:
+        steps = object[0] - pacman_x
+        inLine = object[1] == pacman_y
+    elif facing == Directions.WEST:
+        steps = pacman_x - object[0]
+        inLine = object[1] == pacman_y
+    else:
         return False
 
-    # If Pacman is facing East
-    if facing == Directions.EAST:
-        # Check if the object is anywhere due East of Pacman before a
-        # wall intervenes.
-        next = (pacman_x + 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] + 1, pacman_y)
-        return False
-    
-    # If Pacman is facing West
-    if facing == Directions.WEST:
-        # Check if the object is anywhere due West of Pacman before a
-        # wall intervenes.
-        next = (pacman_x - 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] - 1, pacman_y)
+    # Only whole locations can be in the corridor, just as when
+    # stepping along it.
+    if not inLine or steps < 1 or steps != int(steps):
         return False
+    return steps <= corridorExtent(state, (int(pacman_x), int(pacman_y)), facing)
 
 def atSide(object, facing, state):
     # Returns true if the object is in a side corridor perpendicular
@@ -351,56 +375,86 @@ def visible(objects, state):
     # When passed a list of objects, returns those that are visible to
     # Pacman.
 
+    return visibleLists([objects], state)[0]
+
+def visibleLists(objectLists, state):
+    # When passed a list of lists of objects (food, capsules, ghosts and
+    # so on), returns a list of the visible objects of each of them, as
+    # visible() would. The locations Pacman can see are only worked out
+    # once, however many lists there are.
+
     # If partialVisibility is False, then everything is visible
     if not partialVisibility:
-        return objects
+        return list(objectLists)
 
     # This code creates partial observability by only returning some
-    # of the members of objects.
-    else:
-        facing = state.getPacmanState().configuration.direction
+    # of the members of each list.
+    frontCells, sideCells = visibleCells(state)
+    visibleObjectLists = []
+    for objects in objectLists:
+        # Objects in front come first, and then those to the side.
         visibleObjects = []
         sideObjects = []
-        
-        if facing != Directions.STOP:
-            
-            # If Pacman is moving, visible objects are those in front of,
-            # and to the side (if there are any side corridors).
-            
-            # Objects in front. Visible up to "visibilityLimit"
-            for i in range(len(objects)):
-                if inFront(objects[i], facing, state):
-                    visibleObjects.append(objects[i])
-            visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
-            
-            # Objects to the side. Visible up to "sideLimit"
-            for i in range(len(objects)):
-                if atSide(objects[i], facing, state):
-                    sideObjects.append(objects[i])
-            sideObjects = distanceLimited(sideObjects, state, sideLimit)
-
-            # Combine lists.
-            visibleObjects = visibleObjects + sideObjects
-        
+        for object in objects:
+            if object in frontCells:
+                visibleObjects.append(object)
+            elif object in sideCells:
+                sideObjects.append(object)
+        visibleObjectLists.append(visibleObjects + sideObjects)
+    return visibleObjectLists
+
+def visibleCells(state):
+    # Returns a pair of sets of the locations that Pacman can see: those
+    # in front of it, and those to the side.
+    #
+    # These are exactly the locations that visible() lets through,
+    # since an object can only be in front or to the side if it is in
+    # line with Pacman, when its distance is just the number of steps
+    # along the corridor. So a corridor is visible up to
+    # visibilityLimit or sideLimit steps, or as far as the next wall if
+    # that is nearer.
+
+    pacman = state.getPacmanPosition()
+    pacman = (int(pacman[0]), int(pacman[1]))
+    facing = state.getPacmanState().configuration.direction
+    
+    if facing != Directions.STOP:
+
+        # If Pacman is moving, visible objects are those in front of,
+        # and to the side (if there are any side corridors).
+        if facing == Directions.NORTH or facing == Directions.SOUTH:
+            sides = [Directions.WEST, Directions.EAST]
         else:
+            sides = [Directions.NORTH, Directions.SOUTH]
+        frontCells = corridorCells(state, pacman, [facing], visibilityLimit)
+        sideCells = corridorCells(state, pacman, sides, sideLimit)
 
-            # If Pacman is not moving, they can see in all directions.
-            #
-            # Unfortunately facing will never have value Directions.STOP
-            # after the first move is made, so this code will not run
-            # after the first move :-(
-
-            for i in range(len(objects)):
-                if inFront(objects[i], Directions.NORTH, state):
-                    visibleObjects.append(objects[i])
-                if inFront(objects[i], Directions.SOUTH, state):
-                    visibleObjects.append(objects[i])
-                if inFront(objects[i], Directions.EAST, state):
-                    visibleObjects.append(objects[i])
-                if inFront(objects[i], Directions.WEST, state):
-                    visibleObjects.append(objects[i])
-            visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
-        return visibleObjects
+    else:
+
+        # If Pacman is not moving, they can see in all directions.
+        #
+        # Unfortunately facing will never have value Directions.STOP
+        # after the first move is made, so this code will not run
+        # after the first move :-(
+        frontCells = corridorCells(state, pacman, [Directions.NORTH, Directions.SOUTH,
+                                                   Directions.EAST, Directions.WEST],
+                                   visibilityLimit)
+        sideCells = set()
+    return frontCells, sideCells
+
+def corridorCells(state, position, directions, limit):
+    # Returns the set of locations along the corridors from position in
+    # each of directions, up to limit steps or the next wall.
+
+    cells = set()
+    x, y = position
+    for direction in directions:
+        dx, dy = Actions.directionToVector(direction)
+        dx, dy = int(dx), int(dy)
+        steps = min(corridorExtent(state, position, direction), int(limit))
+        for i in range(1, steps + 1):
+            cells.add((x + i * dx, y + i * dy))
+    return cells
 
 def audible(ghosts, state):
     # A ghost is audible if it is any direction and less than
@@ -0,0 +1,379 @@
+# batchSimulator.py
+# -----------------
+# Plays many games at once, for Monte Carlo rollouts.
+#
+# GameState.generateSuccessor moves one agent in one game at a time, which
+# is far too slow for the millions of short random games that Monte Carlo
+# evaluation needs. A BatchSimulator holds K games as numpy arrays (agent
+# positions, directions and scared timers, the food and capsules left,
+# scores) and moves an agent in all of them with a handful of array
+# operations.
+#
+# The games follow PacmanRules and GhostRules exactly. Pacman plays as
+# sampleAgents.RandomAgent, including the motion model of api.makeMove,
+# and the ghosts as ghostAgents.RandomGhost or DirectionalGhost. Given the
+# same random numbers, a game in the batch makes the same moves and ends
+# with the same score as one played by the scalar engine, which
+# compareWithScalarGames() checks.
+#
+# Ghosts move at half speed when scared, so ghost positions are held
+# doubled, which keeps them whole numbers.
+
+import random
+import time
+
+# numpy is optional. Only the batch simulator needs it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import api
+from game import Directions
+from pacman import SCARED_TIME, COLLISION_TOLERANCE, TIME_PENALTY
+
+# Moves are numbered in alphabetical order, which is the order
+# util.sample() considers a ghost's moves in
+DIRECTIONS = [Directions.EAST, Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.STOP]
+DIRECTION_INDEX = dict((d, i) for i, d in enumerate(DIRECTIONS))
+STOP = 4
+
+if numpy is not None:
+    DX = numpy.array([1, 0, 0, -1, 0])
+    DY = numpy.array([0, 1, -1, 0, 0])
+    # The moves api.selectNewMove() slips into, to the left and right of
+    # each move
+    LEFT = numpy.array([1, 3, 0, 2, STOP])
+    RIGHT = numpy.array([2, 0, 3, 1, STOP])
+
+GHOST_TYPES = ['RandomGhost', 'DirectionalGhost']
+
+class BatchSimulator:
+    """
+    numGames copies of the game in a GameState, played on together.
+
+    After each call to step(), score, win and lose hold the score and
+    outcome of every game, and numMoves the number of moves made in it.
+    uniforms, if given, is called with a boolean array saying which games
+    need a random number, and returns an array of numbers in [0, 1) for
+    all the games; by default they come from numpy, seeded from the
+    random module.  With record set, history[k] lists the (agent index,
+    action) moves of game k, as in Game.moveHistory.
+    """
+    def __init__(self, state, numGames, ghost='RandomGhost', ghostOpts=None,
+                 uniforms=None, record=False):
+        if numpy is None:
+            raise Exception("The batch simulator needs numpy to be installed")
+        if ghost not in GHOST_TYPES:
+            raise Exception("The batch simulator can only play " + ' or '.join(GHOST_TYPES))
+        ghostOpts = ghostOpts or {}
+        if ghost == 'DirectionalGhost' and ghostOpts.get('mazeDistance'):
+            raise Exception("The batch simulator does not support mazeDistance ghosts")
+        self.ghost = ghost
+        self.probAttack = float(ghostOpts.get('prob_attack', 0.8))
+        self.probScaredFlee = float(ghostOpts.get('prob_scaredFlee', 0.8))
+        # The motion model of api.makeMove
+        self.nonDeterministic = api.nonDeterministic
+        self.directionProb = api.directionProb
+        if uniforms == None:
+            generator = numpy.random.RandomState(random.randint(0, 2**32 - 1))
+            uniforms = lambda needed: generator.random_sample(len(needed))
+        self.uniforms = uniforms
+
+        layout = state.data.layout
+        if layout.legalActions == None: layout.initializeLegalActions()
+        self.width = layout.width
+        self.height = layout.height
+        self.numGames = numGames
+        self.numGhosts = state.getNumAgents() - 1
+        # Manhattan distances are doubled along with the positions
+        self.killDistance = int(2 * COLLISION_TOLERANCE)
+
+        # For each cell, Pacman's moves other than Stop in the order
+        # PacmanRules.getLegalActions lists them, and as a bit mask
+        cells = self.width * self.height
+        self.pacmanMoves = numpy.zeros((cells, 4), int)
+        self.pacmanMoveCount = numpy.zeros(cells, int)
+        self.pacmanMask = numpy.zeros(cells, int)
+        # ghostMask[cell, direction] is the bit mask of the moves a ghost
+        # travelling in direction can make from cell
+        self.ghostMask = numpy.zeros((cells, 5), int)
+        for (x, y), actions in layout.legalActions.items():
+            cell = x * self.height + y
+            moves = [DIRECTION_INDEX[a] for a in actions if a != Directions.STOP]
+            self.pacmanMoves[cell, :len(moves)] = moves
+            self.pacmanMoveCount[cell] = len(moves)
+            self.pacmanMask[cell] = sum([1 << m for m in moves])
+            for direction in DIRECTIONS:
+                ghostActions = layout.legalGhostActions[((x, y), direction)]
+                self.ghostMask[cell, DIRECTION_INDEX[direction]] = \
+                    sum([1 << DIRECTION_INDEX[a] for a in ghostActions])
+
+        # The games, each a row
+        K = numGames
+        agentStates = state.data.agentStates
+        x, y = agentStates[0].getPosition()
+        self.pacmanX = numpy.repeat(int(x), K)
+        self.pacmanY = numpy.repeat(int(y), K)
+        self.pacmanDirection = numpy.repeat(DIRECTION_INDEX[agentStates[0].getDirection()], K)
+        ghosts = agentStates[1:]
+        def perGhost(values):
+            return numpy.tile(numpy.array(values, int).reshape(1, -1), (K, 1))
+        self.ghostX = perGhost([int(2 * g.getPosition()[0]) for g in ghosts])
+        self.ghostY = perGhost([int(2 * g.getPosition()[1]) for g in ghosts])
+        self.ghostDirection = perGhost([DIRECTION_INDEX[g.getDirection()] for g in ghosts])
+        self.scaredTimer = perGhost([g.scaredTimer for g in ghosts])
+        self.startX = [int(2 * g.start.getPosition()[0]) for g in ghosts]
+        self.startY = [int(2 * g.start.getPosition()[1]) for g in ghosts]
+        self.startDirection = [DIRECTION_INDEX[g.start.getDirection()] for g in ghosts]
+
+        foodBits = state.getFood().bits
+        food = numpy.array([(foodBits >> i) & 1 for i in range(cells)], bool)
+        self.food = numpy.tile(food, (K, 1))
+        self.foodCount = numpy.repeat(state.getNumFood(), K)
+        self.capsuleCells = [x * self.height + y for x, y in state.getCapsules()]
+        self.capsules = numpy.ones((K, len(self.capsuleCells)), bool)
+
+        self.score = numpy.repeat(state.data.score, K)
+        self.win = numpy.repeat(state.isWin(), K)
+        self.lose = numpy.repeat(state.isLose(), K)
+        self.numMoves = numpy.zeros(K, int)
+        self.numRounds = 0
+        self.record = record
+        if record:
+            self.history = [[] for k in range(K)]
+
+    def isOver(self):
+        return (self.win | self.lose).all()
+
+    def run(self, maxRounds=None):
+        """
+        Plays every game to the end, or for at most maxRounds rounds, and
+        returns the scores.
+        """
+        rounds = 0
+        while not self.isOver() and (maxRounds == None or rounds < maxRounds):
+            self.step()
+            rounds += 1
+        return self.score
+
+    def step(self):
+        """
+        Plays one round of every game that is not over: a move by Pacman
+        and then one by each ghost, as long as the game lasts.
+        """
+        self.movePacman()
+        for index in range(1, self.numGhosts + 1):
+            self.moveGhost(index)
+        self.numRounds += 1
+
+    def recordMoves(self, index, active, actions):
+        self.numMoves[active] += 1
+        if self.record:
+            for k in numpy.flatnonzero(active):
+                self.history[k].append((index, DIRECTIONS[actions[k]]))
+
+    def movePacman(self):
+        active = ~(self.win | self.lose)
+        if not active.any(): return
+        cell = self.pacmanX * self.height + self.pacmanY
+
+        # sampleAgents.RandomAgent picks one of the moves other than Stop
+        count = self.pacmanMoveCount[cell]
+        choice = (self.uniforms(active) * count).astype(int)
+        action = self.pacmanMoves[cell, numpy.minimum(choice, count - 1)]
+        # and api.makeMove sometimes slips to the left or right of it,
+        # or stops if that way is blocked
+        if self.nonDeterministic:
+            slipped = active & ~(self.uniforms(active) <= self.directionProb)
+            left = self.uniforms(slipped) <= 0.5
+            sideways = numpy.where(left, LEFT[action], RIGHT[action])
+            blocked = (self.pacmanMask[cell] >> sideways) & 1 == 0
+            sideways[blocked] = STOP
+            action = numpy.where(slipped, sideways, action)
+        action[~active] = STOP
+        self.recordMoves(0, active, action)
+
+        # PacmanRules.applyAction. There is no Stop direction, so Pacman
+        # keeps facing the same way when stopped.
+        self.pacmanX += DX[action]
+        self.pacmanY += DY[action]
+        moved = action != STOP
+        self.pacmanDirection[moved] = action[moved]
+
+        # PacmanRules.consume
+        scoreChange = numpy.zeros(self.numGames, self.score.dtype)
+        games = numpy.flatnonzero(active)
+        cell = self.pacmanX[games] * self.height + self.pacmanY[games]
+        eaten = self.food[games, cell]
+        eatingGames = games[eaten]
+        self.food[eatingGames, cell[eaten]] = False
+        self.foodCount[eatingGames] -= 1
+        scoreChange[eatingGames] += 10
+        cleared = eatingGames[self.foodCount[eatingGames] == 0]
+        scoreChange[cleared] += 500
+        self.win[cleared] = True
+        cell = self.pacmanX * self.height + self.pacmanY
+        for c, capsuleCell in enumerate(self.capsuleCells):
+            taken = active & self.capsules[:, c] & (cell == capsuleCell)
+            self.capsules[taken, c] = False
+            self.scaredTimer[taken] = SCARED_TIME
+
+        scoreChange[active] -= TIME_PENALTY
+        for g in range(self.numGhosts):
+            self.checkDeath(g, active, scoreChange)
+        self.score += scoreChange
+
+    def moveGhost(self, index):
+        g = index - 1
+        active = ~(self.win | self.lose)
+        if not active.any(): return
+        x, y = self.ghostX[:, g], self.ghostY[:, g]
+        direction = self.ghostDirection[:, g]
+        scared = self.scaredTimer[:, g] > 0
+
+        # GhostRules.getLegalActions. Between cells a ghost has to carry
+        # on the way it is going.
+        onCell = (x | y) & 1 == 0
+        cell = (x // 2) * self.height + y // 2
+        mask = numpy.where(onCell, self.ghostMask[cell, direction], 1 << direction)
+        legal = (mask[:, None] >> numpy.arange(4)) & 1 == 1
+        count = numpy.maximum(legal.sum(1), 1)
+
+        # The ghost's distribution over its moves, built as the
+        # Counter of its getDistribution() is
+        if self.ghost == 'RandomGhost':
+            probs = legal * 1.0
+        else:
+            speed = numpy.where(scared, 1, 2)[:, None]
+            distances = (abs(x[:, None] + DX[:4] * speed - 2 * self.pacmanX[:, None])
+                         + abs(y[:, None] + DY[:4] * speed - 2 * self.pacmanY[:, None]))
+            furthest = numpy.where(legal, distances, -1).max(1)
+            nearest = numpy.where(legal, distances, distances.max() + 1).min(1)
+            bestScore = numpy.where(scared, furthest, nearest)
+            best = legal & (distances == bestScore[:, None])
+            bestProb = numpy.where(scared, self.probScaredFlee, self.probAttack)[:, None]
+            rest = (1 - bestProb) / count[:, None]
+            probs = numpy.where(best, bestProb / numpy.maximum(best.sum(1), 1)[:, None] + rest, rest)
+            probs = probs * legal
+        # Counter.normalize() and then util.sample(), which normalizes
+        # again if the probabilities do not add up to exactly 1. Sums are
+        # taken one move at a time, as Python's sum() does.
+        total = probs[:, 0] + probs[:, 1] + probs[:, 2] + probs[:, 3]
+        probs = probs / numpy.where(total == 0, 1, total)[:, None]
+        total = probs[:, 0] + probs[:, 1] + probs[:, 2] + probs[:, 3]
+        probs = numpy.where((total != 1)[:, None], probs / numpy.where(total == 0, 1, total)[:, None], probs)
+        # util.sample() takes the first move whose cumulative probability
+        # reaches the random number
+        reached = legal & (self.uniforms(active)[:, None] <= probs.cumsum(1))
+        lastLegal = 3 - legal[:, ::-1].argmax(1)
+        action = numpy.where(reached.any(1), reached.argmax(1), lastLegal)
+        action[~active] = STOP
+        self.recordMoves(index, active, action)
+
+        # GhostRules.applyAction, at half speed when scared
+        speed = numpy.where(scared, 1, 2)
+        x += DX[action] * speed
+        y += DY[action] * speed
+        direction[active] = action[active]
+
+        # GhostRules.decrementTimer, which puts a ghost back on a cell
+        # when it stops being scared
+        ending = active & (self.scaredTimer[:, g] == 1)
+        x[ending] += x[ending] & 1
+        y[ending] += y[ending] & 1
+        self.scaredTimer[active, g] = numpy.maximum(0, self.scaredTimer[active, g] - 1)
+
+        scoreChange = numpy.zeros(self.numGames, self.score.dtype)
+        self.checkDeath(g, active, scoreChange)
+        self.score += scoreChange
+
+    def checkDeath(self, g, active, scoreChange):
+        """
+        GhostRules.checkDeath and collide for ghost g (numbered from 0)
+        in the active games.
+        """
+        distance = (abs(self.ghostX[:, g] - 2 * self.pacmanX)
+                    + abs(self.ghostY[:, g] - 2 * self.pacmanY))
+        caught = active & (distance <= self.killDistance)
+        eaten = caught & (self.scaredTimer[:, g] > 0)
+        scoreChange[eaten] += 200
+        self.ghostX[eaten, g] = self.startX[g]
+        self.ghostY[eaten, g] = self.startY[g]
+        self.ghostDirection[eaten, g] = self.startDirection[g]
+        self.scaredTimer[eaten, g] = 0
+        killed = caught & ~eaten & ~self.win
+        scoreChange[killed] -= 500
+        self.lose |= killed
+
+class SeededUniforms:
+    """
+    Random numbers for a BatchSimulator that match those of games played
+    by the scalar engine after random.seed(seed): game k draws from its
+    own generator, seeded with seeds[k], and only when it needs a number.
+    """
+    def __init__(self, seeds):
+        self.generators = [random.Random(seed) for seed in seeds]
+
+    def __call__(self, needed):
+        return numpy.array([generator.random() if n else 0.0
+                            for generator, n in zip(self.generators, needed)])
+
+def playScalarGame(layout, seed, ghost='RandomGhost', ghostOpts=None):
+    """
+    Plays a quiet game of sampleAgents.RandomAgent against the given
+    ghosts with the scalar engine, seeded as runGames() seeds parallel
+    games.
+    """
+    import pacman, sampleAgents, ghostAgents, textDisplay
+    ghostType = getattr(ghostAgents, ghost)
+    ghosts = [ghostType(i + 1, **(ghostOpts or {})) for i in range(layout.getNumGhosts())]
+    random.seed(seed)
+    game = pacman.ClassicGameRules().newGame(layout, sampleAgents.RandomAgent(), ghosts,
+                                             textDisplay.NullGraphics(), True)
+    game.runFast()
+    return game
+
+def compareWithScalarGames(layout, seeds, ghost='RandomGhost', ghostOpts=None):
+    """
+    Plays the seeded games with both the scalar engine and a
+    BatchSimulator, and returns the seeds of any games that came out
+    differently.
+    """
+    import pacman
+    state = pacman.GameState()
+    state.initialize(layout, layout.getNumGhosts())
+    batch = BatchSimulator(state, len(seeds), ghost, ghostOpts, SeededUniforms(seeds), True)
+    batch.run()
+    different = []
+    for k, seed in enumerate(seeds):
+        game = playScalarGame(layout, seed, ghost, ghostOpts)
+        if game.moveHistory != batch.history[k] or game.state.getScore() != batch.score[k] \
+           or game.state.isWin() != batch.win[k]:
+            different.append(seed)
+    return different
+
+if __name__ == '__main__':
+    # Checks the simulator against the scalar engine, and times the two,
+    # for example: python batchSimulator.py mediumClassic 100
+    import sys
+    import layout as layouts
+    import pacman
+    name = 'mediumClassic'
+    numGames = 100
+    if len(sys.argv) > 1: name = sys.argv[1]
+    if len(sys.argv) > 2: numGames = int(sys.argv[2])
+    layout = layouts.getLayout(name)
+    seeds = range(numGames)
+    for ghost in GHOST_TYPES:
+        start = time.time()
+        for seed in seeds: playScalarGame(layout, seed, ghost)
+        scalarTime = time.time() - start
+        state = pacman.GameState()
+        state.initialize(layout, layout.getNumGhosts())
+        start = time.time()
+        BatchSimulator(state, numGames, ghost).run()
+        batchTime = time.time() - start
+        different = compareWithScalarGames(layout, seeds, ghost)
+        print '%s: %d games, %d different from the scalar engine' % (ghost, numGames, len(different))
+        print '  scalar %.0f games/sec, batch %.0f games/sec' % (numGames / scalarTime, numGames / batchTime)
@@ -22,6 +22,7 @@
 
 from util import *
 import time, os
+import random
 import traceback
 import sys
 
@@ -161,10 +162,18 @@ class AgentState:
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
+    A 2-dimensional array of booleans backed by a bitboard.  Data is accessed
     via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
     y vertical and the origin (0,0) in the bottom left corner.
 
+    The whole grid is held in a single Python int, with cell (x,y) at bit
+    x * height + y.  Since ints are immutable, copying a grid just shares the
+    int, and the number of set cells and the hash are cached between writes.
+
+    A grid can be frozen, after which writing to it raises an exception.
+    This lets a grid be shared safely; copies of a frozen grid can be
+    written to as usual.
+
     The __str__ method constructs an output that is oriented like a pacman board.
     """
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
@@ -173,57 +182,127 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        if initialValue:
+            self.bits = (1 << (width * height)) - 1
+            self._count = width * height
+        else:
+            self.bits = 0
+            self._count = 0
+        self._hash = None
+        self._frozen = False
+        self._columns = [None] * width
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
     def __getitem__(self, i):
-        return self.data[i]
+        column = self._columns[i]
+        if column is None:
+            column = self._columns[i] = GridColumn(self, i % self.width)
+        return column
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        column = self[key]
+        for y in range(self.height):
+            column[y] = item[y]
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        return self.bits == other.bits and self.width == other.width and self.height == other.height
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        if self._hash is None:
+            self._hash = hash(self.bits)
+        return self._hash
+
+    def _setCell(self, index, value):
+        if self._frozen: raise Exception('This grid is read-only; write to a copy of it instead')
+        mask = 1 << index
+        if value:
+            if self.bits & mask: return
+            self.bits |= mask
+            if self._count is not None: self._count += 1
+        else:
+            if not self.bits & mask: return
+            self.bits &= ~mask
+            if self._count is not None: self._count -= 1
+        self._hash = None
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.bits = self.bits
+        g._count = self._count
+        g._hash = self._hash
         return g
 
+    def setBits(self, bits):
+        """
+        Sets the whole grid at once from an int with cell (x,y) at bit
+        x * height + y.
+        """
+        if self._frozen: raise Exception('This grid is read-only; write to a copy of it instead')
+        self.bits = bits
+        self._count = None
+        self._hash = None
+
+    def freeze(self):
+        self._frozen = True
+        return self
+
+    def isFrozen(self):
+        return self._frozen
+
     def deepCopy(self):
         return self.copy()
 
+    def __getstate__(self):
+        # Only the contents are pickled, not the cached columns, count and
+        # hash, nor whether the grid is frozen
+        return {'width': self.width, 'height': self.height, 'bits': self.bits}
+
+    def __setstate__(self, state):
+        self.__init__(state['width'], state['height'])
+        if 'bits' in state:
+            self.bits = state['bits']
+        else:
+            # Grids pickled before they were bitboards hold a list of
+            # columns of booleans
+            bits = 0
+            for x, column in enumerate(state['data']):
+                for y, value in enumerate(column):
+                    if value: bits |= 1 << (x * self.height + y)
+            self.bits = bits
+        self._count = None
+
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        # Copies already share the (immutable) bits, so are as cheap as a
+        # shallow copy used to be.
+        return self.copy()
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        if self._count is None:
+            self._count = bin(self.bits).count('1')
+        if item:
+            return self._count
+        return self.width * self.height - self._count
 
     def asList(self, key = True):
+        if key:
+            bits = self.bits
+        else:
+            bits = self.bits ^ ((1 << (self.width * self.height)) - 1)
+        # Walk the set bits, lowest first, which visits cells in the same
+        # x-major order as scanning the grid column by column.
+        digits = bin(bits)[:1:-1]
         list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+        index = digits.find('1')
+        while index != -1:
+            list.append(divmod(index, self.height))
+            index = digits.find('1', index + 1)
         return list
 
     def packBits(self):
@@ -274,6 +353,28 @@ class Grid:
                 bools.append(False)
         return bools
 
+class GridColumn:
+    """
+    One column of a Grid, so that grid[x][y] reads and writes the grid's bits.
+    """
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.height = grid.height
+        self.offset = x * grid.height
+
+    def __getitem__(self, y):
+        if y < 0: y += self.height
+        if y < 0 or y >= self.height: raise IndexError('Grid index out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0: y += self.height
+        if y < 0 or y >= self.height: raise IndexError('Grid index out of range')
+        self.grid._setCell(self.offset + y, value)
+
+    def __len__(self):
+        return self.height
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -368,18 +469,44 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+# Zobrist hashing: each feature of a state (an agent's configuration and
+# scared timer, a piece of food, a capsule) gets a random 64 bit key, and
+# a state's hash is the XOR of the keys of its features.  A successor's
+# hash then only needs the keys of the features that changed XORed in
+# and out.  Keys are made on first use, from a private random generator
+# so that hashing never disturbs the game's random numbers.
+_ZOBRIST_KEYS = {}
+_ZOBRIST_RANDOM = random.Random(188)
+
+def zobristKey( feature ):
+    key = _ZOBRIST_KEYS.get(feature)
+    if key is None:
+        key = _ZOBRIST_KEYS[feature] = _ZOBRIST_RANDOM.getrandbits(64)
+    return key
+
+def agentZobristKey( index, agentState ):
+    conf = agentState.configuration
+    if conf == None:
+        return zobristKey(('agent', index, None, None, agentState.scaredTimer))
+    return zobristKey(('agent', index, conf.pos, conf.direction, agentState.scaredTimer))
+
 class GameStateData:
     """
-
+    Successors are copy-on-write: the food grid, capsule list and agent
+    states are shared with the predecessor until they are changed.  Code
+    that changes an agent state should get it from getWritableAgentState,
+    and food or capsules should be replaced by a changed copy rather than
+    being edited in place.
     """
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
+            self._sharedAgentStates = [True] * len(self.agentStates)
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
@@ -391,17 +518,55 @@ class GameStateData:
         self._lose = False
         self._win = False
         self.scoreChange = 0
+        if prevState != None:
+            self._zobrist = prevState._zobrist
+        else:
+            self._zobrist = None
 
     def deepCopy( self ):
-        state = GameStateData( self )
+        state = self._copy()
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        return state
+
+    def readOnlyCopy( self ):
+        """
+        A copy to hand to an agent, which cannot be used to change this
+        state.  Its food grid is a frozen copy, which shares the (immutable)
+        bits of this state's grid, and everything else is copied as in
+        deepCopy.
+        """
+        state = self._copy()
+        state.food = self.food.copy().freeze()
+        return state
+
+    def _copy( self ):
+        """
+        The part of a copy that deepCopy and readOnlyCopy share: everything
+        but the food.
+        """
+        state = GameStateData( self )
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state._sharedAgentStates = [False] * len(state.agentStates)
+        state._eaten = self._eaten[:]
+        # The layout is never changed once built, so it can be shared
+        state.layout = self.layout
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
         return state
 
+    def getWritableAgentState( self, index ):
+        """
+        Returns the AgentState of agent index, first copying it if it is
+        still shared with the predecessor.
+        """
+        if self._sharedAgentStates[index]:
+            self.agentStates[index] = self.agentStates[index].copy()
+            self._sharedAgentStates[index] = False
+        return self.agentStates[index]
+
     def copyAgentStates( self, agentStates ):
         copiedStates = []
         for agentState in agentStates:
@@ -423,24 +588,53 @@ class GameStateData:
     def __hash__( self ):
         """
         Allows states to be keys of dictionaries.
+
+        Uses the Zobrist hash, which is kept up to date by updateZobrist as
+        successors are generated, so is O(1).
+        """
+        if self._zobrist is None:
+            self._zobrist = self.computeZobrist()
+        return hash((self._zobrist, self.score))
+
+    def computeZobrist( self ):
+        """
+        Computes the Zobrist hash from scratch.
+        """
+        h = 0
+        for index, agentState in enumerate( self.agentStates ):
+            h ^= agentZobristKey(index, agentState)
+        for x, y in self.food.asList():
+            h ^= zobristKey(('food', x, y))
+        for x, y in self.capsules:
+            h ^= zobristKey(('capsule', x, y))
+        return h
+
+    def updateZobrist( self, prevState ):
+        """
+        Updates the hash of a successor of prevState from the agent states,
+        food and capsule that were changed in making it.  Agent states that
+        are still shared with prevState cannot have changed.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        if self._zobrist is None: return
+        h = self._zobrist
+        for index, shared in enumerate( self._sharedAgentStates ):
+            if not shared:
+                h ^= agentZobristKey(index, prevState.agentStates[index])
+                h ^= agentZobristKey(index, self.agentStates[index])
+        if self._foodEaten != None:
+            h ^= zobristKey(('food',) + tuple(self._foodEaten))
+        if self._capsuleEaten != None:
+            h ^= zobristKey(('capsule',) + tuple(self._capsuleEaten))
+        self._zobrist = h
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
         if type(self.food) == type((1,2)):
             self.food = reconstituteGrid(self.food)
-        for x in range(width):
-            for y in range(height):
-                food, walls = self.food, self.layout.walls
-                map[x][y] = self._foodWallStr(food[x][y], walls[x][y])
+        # Grids only hold booleans, so the characters go in plain lists
+        food, walls = self.food, self.layout.walls
+        map = [[self._foodWallStr(food[x][y], walls[x][y]) for y in range(height)]
+               for x in range(width)]
 
         for agentState in self.agentStates:
             if agentState == None: continue
@@ -455,7 +649,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        rows = [''.join([map[x][y] for x in range(width)]) for y in range(height)]
+        rows.reverse()
+        return '\n'.join(rows) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr( self, hasFood, hasWall ):
         if hasFood:
@@ -487,10 +683,13 @@ class GameStateData:
     def initialize( self, layout, numGhostAgents ):
         """
         Creates an initial game state from a layout array (see layout.py).
+
+        The food grid keeps a running count of the food left, which is
+        carried through every copy of it, so getNumFood is O(1).
         """
         self.food = layout.food.copy()
         #self.capsules = []
-        self.capsules = layout.capsules[:]
+        self.capsules = list(layout.capsules)
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
@@ -502,6 +701,7 @@ class GameStateData:
                 if numGhosts == numGhostAgents: continue # Max ghosts reached already
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
+        self._sharedAgentStates = [False] * len(self.agentStates)
         self._eaten = [False for a in self.agentStates]
 
 try:
@@ -587,10 +787,10 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
-                            timed_func(self.state.deepCopy())
+                            timed_func(self.state.readOnlyCopy())
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
@@ -604,7 +804,9 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    start_time = time.time()
+                    agent.registerInitialState(self.state.readOnlyCopy())
+                    self.totalAgentTimes[i] += time.time() - start_time
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -621,10 +823,10 @@ class Game:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = timed_func(self.state.readOnlyCopy())
                         except TimeoutFunctionException:
                             skip_action = True
                         move_time += time.time() - start_time
@@ -634,17 +836,17 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = agent.observationFunction(self.state.readOnlyCopy())
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self.state.readOnlyCopy()
 
             # Solicit an action
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
                     try:
                         start_time = time.time()
                         if skip_action:
@@ -683,7 +885,10 @@ class Game:
                     self.unmute()
                     return
             else:
+                # Not enforced, but kept so that results can report it
+                start_time = time.time()
                 action = agent.getAction(observation)
+                self.totalAgentTimes[agentIndex] += time.time() - start_time
             self.unmute()
 
             # Execute the action
@@ -727,3 +932,103 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def runFast( self ):
+        """
+        A quicker version of run() for trusted agents, when nothing is being
+        shown.  What each agent can do is looked up once rather than every
+        turn, output is never redirected, and with catchExceptions the time
+        limits are checked against the clock after each move rather than
+        enforced with alarms, so a move is never cut short.
+
+        Agents are given the game's own state each turn rather than a copy.
+        The game never changes a state once it has been made, so this is
+        safe as long as the agents don't change it either.
+        """
+        self.display.initialize(self.state.data)
+        self.numMoves = 0
+        numAgents = len( self.agents )
+        rules = self.rules
+
+        for i in range(numAgents):
+            agent = self.agents[i]
+            if not agent:
+                print >>sys.stderr, "Agent %d failed to load" % i
+                self._agentCrash(i, quiet=True)
+                return
+            if hasattr(agent, 'registerInitialState'):
+                start_time = time.time()
+                try:
+                    agent.registerInitialState(self.state.readOnlyCopy())
+                except Exception,data:
+                    if not self.catchExceptions: raise
+                    self._agentCrash(i, quiet=False)
+                    return
+                self.totalAgentTimes[i] += time.time() - start_time
+                if self.catchExceptions and self.totalAgentTimes[i] > rules.getMaxStartupTime(i):
+                    print >>sys.stderr, "Agent %d ran out of time on startup!" % i
+                    self.agentTimeout = True
+                    self._agentCrash(i, quiet=True)
+                    return
+
+        # Everything that run() looks up on every turn
+        observers = [getattr(agent, 'observationFunction', None) for agent in self.agents]
+        getActions = [agent.getAction for agent in self.agents]
+        moveTimeouts = [rules.getMoveTimeout(i) for i in range(numAgents)]
+        warningTimes = [rules.getMoveWarningTime(i) for i in range(numAgents)]
+        maxWarnings = [rules.getMaxTimeWarnings(i) for i in range(numAgents)]
+        maxTotalTimes = [rules.getMaxTotalTime(i) for i in range(numAgents)]
+        totalAgentTimes = self.totalAgentTimes
+        checkTimes = self.catchExceptions
+
+        agentIndex = self.startingIndex
+        try:
+            while not self.gameOver:
+                start_time = time.time()
+                observation = self.state
+                if observers[agentIndex] != None:
+                    observation = observers[agentIndex](observation)
+                action = getActions[agentIndex](observation)
+                move_time = time.time() - start_time
+                totalAgentTimes[agentIndex] += move_time
+
+                if checkTimes:
+                    if move_time > moveTimeouts[agentIndex]:
+                        print >>sys.stderr, "Agent %d timed out on a single move!" % agentIndex
+                        self.agentTimeout = True
+                        self._agentCrash(agentIndex, quiet=True)
+                        return
+                    if move_time > warningTimes[agentIndex]:
+                        self.totalAgentTimeWarnings[agentIndex] += 1
+                        print >>sys.stderr, "Agent %d took too long to make a move! This is warning %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex])
+                        if self.totalAgentTimeWarnings[agentIndex] > maxWarnings[agentIndex]:
+                            print >>sys.stderr, "Agent %d exceeded the maximum number of warnings: %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex])
+                            self.agentTimeout = True
+                            self._agentCrash(agentIndex, quiet=True)
+                            return
+                    if totalAgentTimes[agentIndex] > maxTotalTimes[agentIndex]:
+                        print >>sys.stderr, "Agent %d ran out of time! (time: %1.2f)" % (agentIndex, totalAgentTimes[agentIndex])
+                        self.agentTimeout = True
+                        self._agentCrash(agentIndex, quiet=True)
+                        return
+
+                self.moveHistory.append( (agentIndex, action) )
+                self.state = self.state.generateSuccessor( agentIndex, action )
+                self.display.update( self.state.data )
+                rules.process(self.state, self)
+                if agentIndex == numAgents + 1: self.numMoves += 1
+                agentIndex = ( agentIndex + 1 ) % numAgents
+        except Exception,data:
+            if not self.catchExceptions: raise
+            self._agentCrash(agentIndex)
+            return
+
+        for agentIndex, agent in enumerate(self.agents):
+            if hasattr(agent, 'final'):
+                try:
+                    agent.final( self.state )
+                except Exception,data:
+                    if not self.catchExceptions: raise
+                    self._agentCrash(agentIndex)
+                    return
+        self.display.finish()
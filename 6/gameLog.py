@@ -0,0 +1,369 @@
+# gameLog.py
+# ----------
+# A compact, append-only binary log of recorded games.
+#
+# Many games can be kept in one file. The layout of each game is stored
+# once per file, and every move takes a single byte, so a log is a small
+# fraction of the size of the pickles written by --recordActions. Games
+# can be read back at random, and their moves read from any point on.
+#
+# The file is a sequence of records following the file magic:
+#
+#   layout record:  'LAYT', SHA-1 of the layout text, text length, text
+#   game record:    'GAME', offset of its layout record, seed, number of
+#                   moves, number of agents, flags, then one byte per move,
+#                   then optionally the snapshots
+#
+# All numbers are little-endian. A move byte holds the index of the agent
+# that moved in its top five bits and the action in the bottom three.
+#
+# Snapshots are copies of the game state taken every so many moves, so
+# that the state at any move can be rebuilt from the snapshot before it
+# rather than by replaying the whole game. They are stored as the
+# snapshot interval and count, the length of each snapshot, then the
+# snapshots themselves, each a pickled tuple of the parts of the state.
+#
+# Alongside the log, name.idx holds the offset of each game record as an
+# 8 byte number, so game N can be found without reading the games before
+# it. If the index is missing or out of date the log is scanned instead.
+
+import binascii
+import cPickle
+import os
+import struct
+
+from game import Directions, AgentState, Configuration, reconstituteGrid
+import layout
+
+FILE_MAGIC = 'PACLOG1\n'
+LAYOUT_HEADER = struct.Struct('<4s20sI')
+GAME_HEADER = struct.Struct('<4sQqIBB')
+INDEX_ENTRY = struct.Struct('<Q')
+SNAPSHOT_HEADER = struct.Struct('<II')
+
+# Bits of the game record flags
+HAS_SEED = 1
+HAS_SNAPSHOTS = 2
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict((action, code) for code, action in enumerate(ACTIONS))
+MAX_AGENTS = 32
+
+def isGameLog(filename):
+    """
+    True if filename is a game log rather than a pickled recording.
+    """
+    f = open(filename, 'rb')
+    try: return f.read(len(FILE_MAGIC)) == FILE_MAGIC
+    finally: f.close()
+
+def encodeMoves(moveHistory):
+    codes = []
+    for agentIndex, action in moveHistory:
+        if agentIndex >= MAX_AGENTS or action not in ACTION_CODES:
+            raise Exception('Cannot log move %s by agent %d' % (action, agentIndex))
+        codes.append(chr(agentIndex << 3 | ACTION_CODES[action]))
+    return ''.join(codes)
+
+def decodeMoves(data):
+    return [(ord(c) >> 3, ACTIONS[ord(c) & 7]) for c in data]
+
+def initialState(gameLayout, numAgents):
+    from pacman import GameState
+    state = GameState()
+    state.initialize(gameLayout, numAgents - 1)
+    return state
+
+def snapshotState(state):
+    """
+    Packs up everything needed to carry on a game from state.
+    """
+    data = state.data
+    agents = []
+    for agentState in data.agentStates:
+        start, conf = agentState.start, agentState.configuration
+        agents.append((start.pos, start.direction, conf.pos, conf.direction, agentState.isPacman,
+                       agentState.scaredTimer, agentState.numCarrying, agentState.numReturned))
+    return cPickle.dumps((data.score, data.food.packBits(), data.capsules, agents,
+                          data._eaten, data._lose, data._win), 2)
+
+def restoreState(gameLayout, snapshot):
+    """
+    Rebuilds the GameState packed up by snapshotState.
+    """
+    from pacman import GameState
+    score, food, capsules, agents, eaten, lose, win = cPickle.loads(snapshot)
+    state = GameState()
+    data = state.data
+    data.layout = gameLayout
+    data.score = score
+    data.food = reconstituteGrid(food)
+    data.capsules = list(capsules)
+    data.agentStates = []
+    for startPos, startDirection, pos, direction, isPacman, scaredTimer, numCarrying, numReturned in agents:
+        agentState = AgentState(Configuration(startPos, startDirection), isPacman)
+        agentState.configuration = Configuration(pos, direction)
+        agentState.scaredTimer = scaredTimer
+        agentState.numCarrying = numCarrying
+        agentState.numReturned = numReturned
+        data.agentStates.append(agentState)
+    data._sharedAgentStates = [False] * len(data.agentStates)
+    data._eaten = list(eaten)
+    data._lose = lose
+    data._win = win
+    return state
+
+def takeSnapshots(gameLayout, moveHistory, numAgents, interval):
+    """
+    Replays a game and returns snapshots of it after every interval moves.
+    """
+    snapshots = []
+    state = initialState(gameLayout, numAgents)
+    for i, move in enumerate(moveHistory):
+        state = state.generateSuccessor(*move)
+        if (i + 1) % interval == 0:
+            snapshots.append(snapshotState(state))
+    return snapshots
+
+class GameLogWriter:
+    """
+    Appends games to a game log, creating it if need be.  If
+    snapshotInterval is positive, a snapshot of the state is stored after
+    every snapshotInterval moves of each game.
+    """
+    def __init__(self, filename, snapshotInterval=0):
+        self.filename = filename
+        self.snapshotInterval = snapshotInterval
+        # Offsets of the layout records already in the file
+        self.layoutOffsets = {}
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            # Find the layouts and games already there, dropping any game
+            # left half written, and bring the index up to date
+            reader = GameLogReader(filename)
+            offsets = reader.scan()
+            self.layoutOffsets = dict((h, offset) for offset, h in reader.layoutHashes.items())
+            reader.close()
+            self.file = open(filename, 'r+b')
+            self.file.truncate(reader.end)
+            self.indexFile = open(filename + '.idx', 'wb')
+            self.indexFile.write(struct.pack('<%dQ' % len(offsets), *offsets))
+        else:
+            self.file = open(filename, 'wb')
+            self.file.write(FILE_MAGIC)
+            self.indexFile = open(filename + '.idx', 'wb')
+
+    def addGame(self, gameLayout, moveHistory, numAgents, seed=None):
+        """
+        Appends a game, given the moves it was played with.  seed is the
+        random seed the game was played with, if it had one of its own.
+        """
+        self.file.seek(0, 2)
+        layoutHash = binascii.unhexlify(gameLayout.getContentHash())
+        if layoutHash not in self.layoutOffsets:
+            text = str(gameLayout)
+            self.layoutOffsets[layoutHash] = self.file.tell()
+            self.file.write(LAYOUT_HEADER.pack('LAYT', layoutHash, len(text)))
+            self.file.write(text)
+
+        offset = self.file.tell()
+        flags = 0
+        if seed is not None: flags |= HAS_SEED
+        else: seed = 0
+        moves = encodeMoves(moveHistory)
+        snapshots = []
+        if self.snapshotInterval > 0:
+            snapshots = takeSnapshots(gameLayout, moveHistory, numAgents, self.snapshotInterval)
+            flags |= HAS_SNAPSHOTS
+        self.file.write(GAME_HEADER.pack('GAME', self.layoutOffsets[layoutHash], seed,
+                                         len(moveHistory), numAgents, flags))
+        self.file.write(moves)
+        if flags & HAS_SNAPSHOTS:
+            self.file.write(SNAPSHOT_HEADER.pack(self.snapshotInterval, len(snapshots)))
+            self.file.write(struct.pack('<%dI' % len(snapshots), *[len(s) for s in snapshots]))
+            self.file.write(''.join(snapshots))
+        self.file.flush()
+        # The index entry goes last, so an index never points past the log
+        self.indexFile.write(INDEX_ENTRY.pack(offset))
+        self.indexFile.flush()
+
+    def close(self):
+        self.file.close()
+        self.indexFile.close()
+
+class GameLogReader:
+    """
+    Reads games back from a game log.  Games are numbered from 0 in the
+    order they were added.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        if self.file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise Exception('%s is not a game log' % filename)
+        self.size = os.path.getsize(filename)
+        self.layouts = {}
+        self.layoutHashes = {}
+        self.gameOffsets = self.readIndex()
+        if self.gameOffsets is None:
+            self.gameOffsets = self.scan()
+
+    def readIndex(self):
+        """
+        Returns the game offsets from the index file, or None if there is
+        no index or it does not cover the whole log.
+        """
+        indexName = self.filename + '.idx'
+        if not os.path.exists(indexName): return None
+        f = open(indexName, 'rb')
+        try: data = f.read()
+        finally: f.close()
+        count = len(data) // INDEX_ENTRY.size
+        offsets = list(struct.unpack('<%dQ' % count, data[:count * INDEX_ENTRY.size]))
+        # The last game indexed must end where the log does
+        if offsets:
+            header = self.readGameHeader(offsets[-1])
+            if header is None or header['end'] != self.size:
+                return None
+        elif self.size != len(FILE_MAGIC):
+            return None
+        return offsets
+
+    def scan(self):
+        """
+        Finds the offset of every game by reading the record headers.
+        """
+        offsets = []
+        offset = len(FILE_MAGIC)
+        while offset < self.size:
+            self.file.seek(offset)
+            kind = self.file.read(4)
+            if kind == 'LAYT':
+                self.file.seek(offset)
+                data = self.file.read(LAYOUT_HEADER.size)
+                if len(data) != LAYOUT_HEADER.size: break
+                kind, layoutHash, length = LAYOUT_HEADER.unpack(data)
+                if offset + LAYOUT_HEADER.size + length > self.size: break
+                self.layoutHashes[offset] = layoutHash
+                offset += LAYOUT_HEADER.size + length
+            elif kind == 'GAME':
+                header = self.readGameHeader(offset)
+                # A game cut short by a crash while it was being written
+                if header is None or header['end'] > self.size: break
+                offsets.append(offset)
+                offset = header['end']
+            elif len(kind) < 4:
+                break
+            else:
+                raise Exception('Bad record at offset %d of %s' % (offset, self.filename))
+        # Where the last whole record ends
+        self.end = offset
+        return offsets
+
+    def readGameHeader(self, offset):
+        """
+        Reads the header of the game record at offset, along with where its
+        snapshots are and where the record ends.  Returns None if there is
+        no whole header there.
+        """
+        self.file.seek(offset)
+        data = self.file.read(GAME_HEADER.size)
+        if len(data) != GAME_HEADER.size: return None
+        kind, layoutOffset, seed, numMoves, numAgents, flags = GAME_HEADER.unpack(data)
+        if kind != 'GAME': return None
+        if not flags & HAS_SEED: seed = None
+        header = {'offset': offset, 'layoutOffset': layoutOffset, 'seed': seed,
+                  'numMoves': numMoves, 'numAgents': numAgents,
+                  'snapshotInterval': 0, 'snapshots': []}
+
+        # Each snapshot as an (offset, length) pair
+        end = offset + GAME_HEADER.size + numMoves
+        if flags & HAS_SNAPSHOTS:
+            self.file.seek(end)
+            data = self.file.read(SNAPSHOT_HEADER.size)
+            if len(data) != SNAPSHOT_HEADER.size: return None
+            interval, count = SNAPSHOT_HEADER.unpack(data)
+            data = self.file.read(4 * count)
+            if len(data) != 4 * count: return None
+            header['snapshotInterval'] = interval
+            end += SNAPSHOT_HEADER.size + 4 * count
+            for length in struct.unpack('<%dI' % count, data):
+                header['snapshots'].append((end, length))
+                end += length
+        header['end'] = end
+        return header
+
+    def __len__(self):
+        return len(self.gameOffsets)
+
+    def getGame(self, n):
+        """
+        Returns the header of game n: its seed, number of moves, number
+        of agents and snapshots.
+        """
+        if n < 0 or n >= len(self.gameOffsets):
+            raise Exception('There is no game %d: %s only has %d games' % (n, self.filename, len(self.gameOffsets)))
+        return self.readGameHeader(self.gameOffsets[n])
+
+    def getLayout(self, n):
+        """
+        Returns the Layout game n was played on.
+        """
+        layoutOffset = self.getGame(n)['layoutOffset']
+        if layoutOffset not in self.layouts:
+            self.file.seek(layoutOffset)
+            kind, layoutHash, length = LAYOUT_HEADER.unpack(self.file.read(LAYOUT_HEADER.size))
+            text = self.file.read(length)
+            self.layoutHashes[layoutOffset] = layoutHash
+            self.layouts[layoutOffset] = layout.layoutFromText(text.split('\n'))
+        return self.layouts[layoutOffset]
+
+    def getMoves(self, n, start=0, end=None):
+        """
+        Returns the moves of game n from move start up to (not including)
+        move end, as (agentIndex, action) pairs.
+        """
+        return list(self.iterMoves(n, start, end))
+
+    def iterMoves(self, n, start=0, end=None, chunkSize=4096):
+        """
+        Yields the moves of game n from move start on, reading them from
+        the file a chunk at a time.
+        """
+        header = self.getGame(n)
+        if end is None or end > header['numMoves']: end = header['numMoves']
+        position = header['offset'] + GAME_HEADER.size + start
+        last = header['offset'] + GAME_HEADER.size + end
+        while position < last:
+            self.file.seek(position)
+            data = self.file.read(min(chunkSize, last - position))
+            position += len(data)
+            for move in decodeMoves(data):
+                yield move
+
+    def getState(self, n, move):
+        """
+        Returns the GameState of game n after its first move moves, built
+        from the last snapshot at or before that move.
+        """
+        header = self.getGame(n)
+        if move < 0 or move > header['numMoves']:
+            raise Exception('Game %d only has %d moves' % (n, header['numMoves']))
+        gameLayout = self.getLayout(n)
+        interval = header['snapshotInterval']
+        snapshot = 0
+        if interval > 0:
+            snapshot = min(move // interval, len(header['snapshots']))
+        if snapshot > 0:
+            offset, length = header['snapshots'][snapshot - 1]
+            self.file.seek(offset)
+            state = restoreState(gameLayout, self.file.read(length))
+            start = snapshot * interval
+        else:
+            state = initialState(gameLayout, header['numAgents'])
+            start = 0
+        for action in self.iterMoves(n, start, move):
+            state = state.generateSuccessor(*action)
+        return state
+
+    def close(self):
+        self.file.close()
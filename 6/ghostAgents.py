@@ -43,11 +43,18 @@ class RandomGhost( GhostAgent ):
         return dist
 
 class DirectionalGhost( GhostAgent ):
-    "A ghost that prefers to rush Pacman, or flee when scared."
-    def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8 ):
+    """
+    A ghost that prefers to rush Pacman, or flee when scared.
+
+    With mazeDistance set, distances to Pacman are measured through the
+    maze rather than as the crow flies.
+    """
+    def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8, mazeDistance=False ):
         self.index = index
-        self.prob_attack = prob_attack
-        self.prob_scaredFlee = prob_scaredFlee
+        self.prob_attack = float(prob_attack)
+        self.prob_scaredFlee = float(prob_scaredFlee)
+        # Agent arguments arrive from the command line as strings
+        self.mazeDistance = str(mazeDistance).lower() not in ['0', 'false', '']
 
     def getDistribution( self, state ):
         # Read variables from state
@@ -64,7 +71,11 @@ class DirectionalGhost( GhostAgent ):
         pacmanPosition = state.getPacmanPosition()
 
         # Select best actions given the state
-        distancesToPacman = [manhattanDistance( pos, pacmanPosition ) for pos in newPositions]
+        if self.mazeDistance:
+            distance = state.data.layout.getMazeDistances().getDistance
+        else:
+            distance = manhattanDistance
+        distancesToPacman = [distance( pos, pacmanPosition ) for pos in newPositions]
         if isScared:
             bestScore = max( distancesToPacman )
             bestProb = self.prob_scaredFlee
@@ -13,18 +13,42 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, Directions, Actions, Configuration
+from array import array
+from collections import OrderedDict
+import cPickle
+import hashlib
 import os
 import random
 
-VISIBILITY_MATRIX_CACHE = {}
+# Visibility indexes of recently used layouts, keyed by layout hash, most
+# recently used last.  Only VISIBILITY_CACHE_LIMIT are kept.
+VISIBILITY_CACHE = OrderedDict()
+VISIBILITY_CACHE_LIMIT = 32
+
+# Every layout made so far, keyed by the hash of its text, so that each
+# distinct layout is parsed once and then shared by everything that uses
+# it.  Layouts never change once made, so sharing them is safe.
+LAYOUT_CACHE = {}
+
+# The layout found for each name, keyed by (directory searched from, name)
+LAYOUT_NAMES = {}
+
+# Compiled layouts hold the parsed layout, so they load without parsing
+# the text.  They sit next to the .lay file they were compiled from.
+COMPILED_SUFFIX = '.layc'
+COMPILED_VERSION = 1
 
 class Layout:
     """
     A Layout manages the static information about the game board.
     """
 
-    def __init__(self, layoutText):
+    def __init__(self, layoutText, compiled=None):
+        """
+        Parses layoutText, a list of rows.  If compiled (the contents of a
+        compiled layout) is given, the parsed layout is taken from it instead.
+        """
         self.width = len(layoutText[0])
         self.height= len(layoutText)
         self.walls = Grid(self.width, self.height, False)
@@ -32,34 +56,46 @@ class Layout:
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
-        self.processLayoutText(layoutText)
+        if compiled == None:
+            self.processLayoutText(layoutText)
+        else:
+            self.walls.setBits(compiled['walls'])
+            self.food.setBits(compiled['food'])
+            self.capsules = list(compiled['capsules'])
+            self.agentPositions = list(compiled['agentPositions'])
+            self.numGhosts = compiled['numGhosts']
+        # Layouts are shared by every state of a game, so must not change
+        self.walls.freeze()
+        self.food.freeze()
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
-        # self.initializeVisibilityMatrix()
+        self._contentHash = None
+        self.totalFood = self.food.count()
+        # Built the first time the legal actions of an agent are needed
+        self.legalActions = None
+        self.legalGhostActions = None
+        self.successors = None
 
     def getNumGhosts(self):
         return self.numGhosts
 
-    def initializeVisibilityMatrix(self):
-        global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
-            from game import Directions
-            vecs = [(-0.5,0), (0.5,0),(0,-0.5),(0,0.5)]
-            dirs = [Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()})
-            for x in range(self.width):
-                for y in range(self.height):
-                    if self.walls[x][y] == False:
-                        for vec, direction in zip(vecs, dirs):
-                            dx, dy = vec
-                            nextx, nexty = x + dx, y + dy
-                            while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)] :
-                                vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
-            self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
+    def getVisibilityIndex(self):
+        """
+        Returns the VisibilityIndex of this layout from VISIBILITY_CACHE,
+        building it if the layout has not been used recently.  The layout
+        does not keep the index itself, so that evicting it from the
+        cache frees it.
+        """
+        key = self.getContentHash()
+        if key in VISIBILITY_CACHE:
+            visibility = VISIBILITY_CACHE.pop(key)
         else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
+            visibility = VisibilityIndex(self.walls)
+        VISIBILITY_CACHE[key] = visibility
+        while len(VISIBILITY_CACHE) > VISIBILITY_CACHE_LIMIT:
+            VISIBILITY_CACHE.popitem(last=False)
+        return visibility
 
     def isWall(self, pos):
         x, col = pos
@@ -82,15 +118,102 @@ class Layout:
         dist, pos = max([(manhattanDistance(p, pacPos), p) for p in poses])
         return pos
 
+    def initializeLegalActions(self):
+        """
+        Works out, for every non-wall cell, the actions that are legal
+        there, as tuples in the order Actions.getPossibleActions gives
+        them:
+
+        legalActions[cell]                    those of Pacman
+        legalGhostActions[(cell, direction)]  those of a ghost travelling
+                                              in direction
+        successors[cell]                      the cells the non-Stop
+                                              actions lead to
+        """
+        legalActions = {}
+        legalGhostActions = {}
+        successors = {}
+        for x in range(self.width):
+            for y in range(self.height):
+                if self.walls[x][y]: continue
+                actions = Actions.getPossibleActions(Configuration((x, y), Directions.STOP), self.walls)
+                legalActions[(x, y)] = tuple(actions)
+                successors[(x, y)] = tuple([(x + Actions._directions[a][0], y + Actions._directions[a][1])
+                                            for a in actions if a != Directions.STOP])
+                # As in GhostRules.getLegalActions, ghosts cannot stop,
+                # or turn around unless at a dead end
+                for direction in Actions._directions:
+                    ghostActions = [a for a in actions if a != Directions.STOP]
+                    reverse = Actions.reverseDirection(direction)
+                    if reverse in ghostActions and len(ghostActions) > 1:
+                        ghostActions.remove(reverse)
+                    legalGhostActions[((x, y), direction)] = tuple(ghostActions)
+        self.successors = successors
+        self.legalGhostActions = legalGhostActions
+        self.legalActions = legalActions
+
     def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
-        row, col = [int(x) for x in pacPos]
-        return ghostPos in self.visibility[row][col][pacDirection]
+        """
+        True if ghostPos is in the line of sight of Pacman, at pacPos
+        facing pacDirection.
+        """
+        return self.getVisibilityIndex().isVisible(ghostPos, pacPos, pacDirection)
+
+    def getContentHash(self):
+        """
+        The SHA-1 hex digest of the layout text, which identifies the
+        layout whichever file it came from.
+        """
+        if self._contentHash is None:
+            self._contentHash = hashlib.sha1(str(self)).hexdigest()
+        return self._contentHash
+
+    def getMazeDistances(self):
+        """
+        The distances through the maze between every pair of cells, as a
+        MazeDistances (see mazeDistances.py), built the first time it is
+        asked for and cached on disk.
+        """
+        import mazeDistances
+        return mazeDistances.getMazeDistances(self)
+
+    def getMazeGraph(self):
+        """
+        The junctions and dead ends of the maze and the corridors between
+        them, as a MazeGraph (see mazeGraph.py), built the first time it
+        is asked for.
+        """
+        import mazeGraph
+        return mazeGraph.getMazeGraph(self)
 
     def __str__(self):
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        # Layouts never change, so there is no need to copy one
+        return self
+
+    def __getstate__(self):
+        # The legal action tables are rebuilt when needed rather than
+        # pickled, which would make every recorded game several times
+        # larger
+        state = self.__dict__.copy()
+        for table in ['legalActions', 'legalGhostActions', 'successors']:
+            state[table] = None
+        return state
+
+    def __setstate__(self, state):
+        # Layouts in recordings made by older versions of this code do not
+        # have everything that __init__ now sets up
+        self.__dict__.update(state)
+        self._contentHash = state.get('_contentHash')
+        self.legalActions = None
+        self.legalGhostActions = None
+        self.successors = None
+        self.walls.freeze()
+        self.food.freeze()
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
 
     def processLayoutText(self, layoutText):
         """
@@ -128,22 +251,143 @@ class Layout:
         elif layoutChar in  ['1', '2', '3', '4']:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
+class VisibilityIndex:
+    """
+    How far it is possible to see along a straight line from each cell of
+    a maze.  For each non-wall cell and each of the four directions, the
+    number of open cells before the next wall is kept as a small int in a
+    flat array, at index 4 * (x * height + y) + direction.
+    """
+    DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+    VECTORS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+    DIRECTION_INDEX = dict((d, i) for i, d in enumerate(DIRECTIONS))
+
+    def __init__(self, walls):
+        self.width = walls.width
+        self.height = walls.height
+        if max(self.width, self.height) < 256: typecode = 'B'
+        else: typecode = 'H'
+        self.extents = array(typecode, [0] * (4 * self.width * self.height))
+        # Each extent is one more than that of the next cell along, so
+        # each line of cells is filled in starting from its far end
+        for d, (dx, dy) in enumerate(self.VECTORS):
+            xs = range(self.width)
+            ys = range(self.height)
+            if dx > 0: xs.reverse()
+            if dy > 0: ys.reverse()
+            for x in xs:
+                for y in ys:
+                    if walls[x][y]: continue
+                    nextX, nextY = x + dx, y + dy
+                    if 0 <= nextX < self.width and 0 <= nextY < self.height and not walls[nextX][nextY]:
+                        extent = self.extents[4 * (nextX * self.height + nextY) + d] + 1
+                    else:
+                        extent = 0
+                    self.extents[4 * (x * self.height + y) + d] = extent
+
+    def getExtent(self, pos, direction):
+        """
+        The number of open cells in a straight line from pos in direction
+        before a wall.
+        """
+        x, y = pos
+        return self.extents[4 * (x * self.height + y) + self.DIRECTION_INDEX[direction]]
+
+    def isVisible(self, ghostPos, pacPos, pacDirection):
+        """
+        True if ghostPos is on the line from Pacman at pacPos in direction
+        pacDirection, at a whole or half step short of the next wall.
+        Nothing is visible when Pacman is stopped.
+        """
+        d = self.DIRECTION_INDEX.get(pacDirection)
+        if d == None: return False
+        x, y = [int(i) for i in pacPos]
+        dx, dy = self.VECTORS[d]
+        # How many steps along the line the ghost is, and how far it is
+        # off the line
+        along = (ghostPos[0] - x) * dx + (ghostPos[1] - y) * dy
+        across = (ghostPos[0] - x) * dy + (ghostPos[1] - y) * dx
+        if across != 0 or along <= 0 or along * 2 != int(along * 2): return False
+        return along <= self.extents[4 * (x * self.height + y) + d] + 0.5
+
 def getLayout(name, back = 2):
+    """
+    Returns the layout called name, looking in layouts/ and then the
+    current directory, and then the same in each of up to back + 1
+    directories above.  Each layout is read once, and the same Layout is
+    returned every time after that.
+    """
+    key = (os.path.abspath('.'), name, back)
+    if key in LAYOUT_NAMES: return LAYOUT_NAMES[key]
     if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None: layout = tryToLoad(name)
+        names = [os.path.join('layouts', name), name]
     else:
-        layout = tryToLoad('layouts/' + name + '.lay')
-        if layout == None: layout = tryToLoad(name + '.lay')
-    if layout == None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back -1)
-        os.chdir(curdir)
-    return layout
+        names = [os.path.join('layouts', name + '.lay'), name + '.lay']
+    layout = None
+    for level in range(back + 2):
+        for fullname in names:
+            layout = tryToLoad(os.path.join(*(['..'] * level + [fullname])))
+            if layout != None:
+                LAYOUT_NAMES[key] = layout
+                return layout
+    return None
 
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
+    compiledName = os.path.splitext(fullname)[0] + COMPILED_SUFFIX
+    if os.path.exists(compiledName) and os.path.getmtime(compiledName) >= os.path.getmtime(fullname):
+        layout = loadCompiledLayout(compiledName)
+        if layout != None: return layout
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: return layoutFromText([line.strip() for line in f])
     finally: f.close()
+
+def layoutFromText(layoutText):
+    """
+    Returns the shared Layout for layoutText, a list of rows, parsing it
+    only if it has not been seen before.
+    """
+    contentHash = hashlib.sha1("\n".join(layoutText)).hexdigest()
+    if contentHash not in LAYOUT_CACHE:
+        layout = Layout(layoutText)
+        layout._contentHash = contentHash
+        LAYOUT_CACHE[contentHash] = layout
+    return LAYOUT_CACHE[contentHash]
+
+def compileLayout(layout, filename):
+    """
+    Writes layout to filename in compiled form.
+    """
+    compiled = {'version': COMPILED_VERSION, 'hash': layout.getContentHash(),
+                'text': layout.layoutText, 'walls': layout.walls.bits, 'food': layout.food.bits,
+                'capsules': layout.capsules, 'agentPositions': layout.agentPositions,
+                'numGhosts': layout.numGhosts}
+    f = open(filename, 'wb')
+    try: cPickle.dump(compiled, f, 2)
+    finally: f.close()
+
+def loadCompiledLayout(filename):
+    """
+    Returns the shared Layout held in a compiled layout file, or None if
+    the file was written by a different version of this code.
+    """
+    f = open(filename, 'rb')
+    try: compiled = cPickle.load(f)
+    except Exception: return None
+    finally: f.close()
+    if type(compiled) != dict or compiled.get('version') != COMPILED_VERSION: return None
+    if compiled['hash'] not in LAYOUT_CACHE:
+        layout = Layout(compiled['text'], compiled)
+        layout._contentHash = compiled['hash']
+        LAYOUT_CACHE[compiled['hash']] = layout
+    return LAYOUT_CACHE[compiled['hash']]
+
+if __name__ == '__main__':
+    # Compiles the layout files given on the command line, for example
+    # python layout.py layouts/*.lay
+    import sys
+    for fullname in sys.argv[1:]:
+        f = open(fullname)
+        try: layout = layoutFromText([line.strip() for line in f])
+        finally: f.close()
+        compileLayout(layout, os.path.splitext(fullname)[0] + COMPILED_SUFFIX)
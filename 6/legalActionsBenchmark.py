@@ -0,0 +1,104 @@
+# legalActionsBenchmark.py
+# ------------------------
+# Times the legal action tables of a layout (Layout.initializeLegalActions)
+# against working the actions out from the walls each time, as
+# Actions.getPossibleActions does, for example:
+#
+# python legalActionsBenchmark.py mediumClassic 20
+#
+# For every non-wall cell of the layout it times PacmanRules and
+# GhostRules.getLegalActions, the cells each cell leads to, and
+# GameState.generateSuccessor, which asks for the legal actions of the
+# agent that moves. The rules fall back to Actions.getPossibleActions
+# for a cell missing from the tables, so emptying the tables times the
+# old way of doing it through the same code.
+
+import sys
+import time
+
+import layout as layouts
+from game import Actions, Configuration, Directions
+from pacman import GameState, PacmanRules, GhostRules
+
+GHOST_DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+
+def getCells(layout):
+    return [(x, y) for x in range(layout.width) for y in range(layout.height)
+            if not layout.walls[x][y]]
+
+def getStates(layout, cells, agentIndex):
+    """
+    One state per cell, with the agent agentIndex there and the others
+    where the layout starts them. Ghosts face each way in turn.
+    """
+    start = GameState()
+    start.initialize(layout, layout.getNumGhosts())
+    states = []
+    for i in range(len(cells)):
+        state = start.deepCopy()
+        if agentIndex == 0: direction = Directions.STOP
+        else: direction = GHOST_DIRECTIONS[i % len(GHOST_DIRECTIONS)]
+        state.data.agentStates[agentIndex].configuration = Configuration(cells[i], direction)
+        states.append(state)
+    return states
+
+def oldSuccessors(layout, cell):
+    actions = Actions.getPossibleActions(Configuration(cell, Directions.STOP), layout.walls)
+    return tuple([Actions.getSuccessor(cell, a) for a in actions if a != Directions.STOP])
+
+def timeCalls(function, args, repeats):
+    """
+    The number of calls of function per second, calling it repeats times
+    on each of args, and the results of the last round of calls.
+    """
+    start = time.time()
+    for r in range(repeats):
+        results = [function(*a) for a in args]
+    return repeats * len(args) / (time.time() - start), results
+
+def timeAll(layout, cells, pacmanStates, ghostStates, repeats):
+    """
+    Calls per second, and results, of each of the timed calls, with
+    whatever tables layout has.
+    """
+    ghostIndex = 1
+    timings = []
+    timings.append(timeCalls(PacmanRules.getLegalActions, [(s,) for s in pacmanStates], repeats))
+    timings.append(timeCalls(GhostRules.getLegalActions, [(s, ghostIndex) for s in ghostStates], repeats))
+    if layout.successors: successors = lambda cell: layout.successors[cell]
+    else: successors = lambda cell: oldSuccessors(layout, cell)
+    timings.append(timeCalls(successors, [(c,) for c in cells], repeats))
+    # A successor costs far more than the actions, so fewer rounds do
+    pacmanMoves = [(s, 0, PacmanRules.getLegalActions(s)[0]) for s in pacmanStates]
+    ghostMoves = [(s, ghostIndex, GhostRules.getLegalActions(s, ghostIndex)[0]) for s in ghostStates]
+    rounds = max(1, repeats / 10)
+    speed, results = timeCalls(GameState.generateSuccessor, pacmanMoves, rounds)
+    timings.append((speed, [s.getPacmanPosition() for s in results]))
+    speed, results = timeCalls(GameState.generateSuccessor, ghostMoves, rounds)
+    timings.append((speed, [s.getGhostPosition(ghostIndex) for s in results]))
+    return timings
+
+if __name__ == '__main__':
+    name = 'mediumClassic'
+    repeats = 20
+    if len(sys.argv) > 1: name = sys.argv[1]
+    if len(sys.argv) > 2: repeats = int(sys.argv[2])
+    layout = layouts.getLayout(name)
+    if layout.getNumGhosts() == 0:
+        raise Exception("The layout " + name + " has no ghosts to time")
+    cells = getCells(layout)
+    pacmanStates = getStates(layout, cells, 0)
+    ghostStates = getStates(layout, cells, 1)
+    # Empty tables: every cell is missing, so the rules use the walls
+    layout.legalActions, layout.legalGhostActions, layout.successors = {}, {}, {}
+    old = timeAll(layout, cells, pacmanStates, ghostStates, repeats)
+    layout.initializeLegalActions()
+    new = timeAll(layout, cells, pacmanStates, ghostStates, repeats)
+    names = ['PacmanRules.getLegalActions', 'GhostRules.getLegalActions', 'successor cells',
+             'Pacman generateSuccessor', 'ghost generateSuccessor']
+    print '%s: %d cells' % (name, len(cells))
+    for i in range(len(names)):
+        (oldSpeed, oldResults), (newSpeed, newResults) = old[i], new[i]
+        if oldResults != newResults:
+            raise Exception("The tables give different results for " + names[i])
+        print '  %-28s old %9.0f/sec, tables %9.0f/sec (x%.1f)' % (names[i], oldSpeed, newSpeed, newSpeed / oldSpeed)
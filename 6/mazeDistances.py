@@ -0,0 +1,173 @@
+# mazeDistances.py
+# ----------------
+# True distances through the maze between every pair of cells of a layout.
+#
+# util.manhattanDistance ignores walls, so two cells either side of a wall
+# look close even when the way round is long. Here a breadth first search
+# from every non-wall cell fills in a table of the real number of moves
+# between each pair, which is built once per layout and after that makes
+# every distance a single lookup.
+#
+# The table is a flat array('H') with one row per cell, so it takes two
+# bytes per pair of cells (under a megabyte for the largest layouts that
+# come with the code). Tables are kept in memory by layout, and on disk in
+# CACHE_DIR keyed by the hash of the layout text, so each layout is only
+# ever searched once.
+
+from array import array
+import math
+import os
+import sys
+
+# Where tables are cached between runs
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.mazeDistances')
+CACHE_MAGIC = 'MAZEDIST1' + sys.byteorder[0]
+
+# Table entry for cells that cannot reach each other
+UNREACHABLE = 0xFFFF
+
+# Tables already loaded or built, keyed by layout hash
+MEMORY_CACHE = {}
+
+def getMazeDistances(layout):
+    """
+    Returns the MazeDistances of layout, loading it from the disk cache or
+    building it if need be.
+    """
+    key = layout.getContentHash()
+    if key not in MEMORY_CACHE:
+        distances = MazeDistances(layout.walls, loadTable(key))
+        if distances.table is None:
+            distances.table = distances.computeTable()
+            saveTable(key, distances.table)
+        MEMORY_CACHE[key] = distances
+    return MEMORY_CACHE[key]
+
+def loadTable(key):
+    filename = os.path.join(CACHE_DIR, key + '.dist')
+    if not os.path.exists(filename): return None
+    f = open(filename, 'rb')
+    try:
+        if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC: return None
+        table = array('H')
+        table.fromstring(f.read())
+        return table
+    finally:
+        f.close()
+
+def saveTable(key, table):
+    # Written under a temporary name and then renamed, so that processes
+    # sharing the cache never see half a table. The cache is only an
+    # optimisation, so failing to write it is not an error.
+    filename = os.path.join(CACHE_DIR, key + '.dist')
+    temporary = '%s.%d' % (filename, os.getpid())
+    try:
+        if not os.path.isdir(CACHE_DIR): os.makedirs(CACHE_DIR)
+        f = open(temporary, 'wb')
+        try:
+            f.write(CACHE_MAGIC)
+            f.write(table.tostring())
+        finally:
+            f.close()
+        os.rename(temporary, filename)
+    except (IOError, OSError):
+        pass
+
+class MazeDistances:
+    """
+    Distances through the maze between the non-wall cells of a walls
+    Grid.  Positions between two cells (as scared ghosts can be) are
+    measured through whichever of the cells around them is nearer.
+    Cells that cannot be reached, and walls, are infinitely far away.
+    """
+    def __init__(self, walls, table=None):
+        self.cells = []
+        for x in range(walls.width):
+            for y in range(walls.height):
+                if not walls[x][y]:
+                    self.cells.append((x, y))
+        self.index = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.size = len(self.cells)
+        if table is not None and len(table) != self.size * self.size:
+            table = None
+        self.table = table
+
+    def computeTable(self):
+        """
+        Runs a breadth first search from every cell.
+        """
+        n = self.size
+        neighbours = []
+        for x, y in self.cells:
+            neighbours.append([self.index[p] for p in [(x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y)]
+                               if p in self.index])
+        table = array('H')
+        for source in range(n):
+            row = [UNREACHABLE] * n
+            row[source] = 0
+            frontier = [source]
+            distance = 0
+            while frontier:
+                distance += 1
+                reached = []
+                for i in frontier:
+                    for j in neighbours[i]:
+                        if row[j] == UNREACHABLE:
+                            row[j] = distance
+                            reached.append(j)
+                frontier = reached
+            table.fromlist(row)
+        return table
+
+    def cellsNear(self, pos):
+        """
+        Returns (cell index, distance to it) for the cells that pos is on
+        or between.
+        """
+        if pos in self.index:
+            return [(self.index[pos], 0)]
+        x, y = pos
+        near = []
+        for cellX in set([int(math.floor(x)), int(math.ceil(x))]):
+            for cellY in set([int(math.floor(y)), int(math.ceil(y))]):
+                i = self.index.get((cellX, cellY))
+                if i is not None:
+                    near.append((i, abs(x - cellX) + abs(y - cellY)))
+        return near
+
+    def getDistance(self, a, b):
+        """
+        The number of moves it takes to get from a to b.
+        """
+        i = self.index.get(a)
+        j = self.index.get(b)
+        if i is not None and j is not None:
+            distance = self.table[i * self.size + j]
+            if distance == UNREACHABLE: return float('inf')
+            return distance
+        best = float('inf')
+        for i, extraA in self.cellsNear(a):
+            for j, extraB in self.cellsNear(b):
+                distance = self.table[i * self.size + j]
+                if distance != UNREACHABLE:
+                    best = min(best, distance + extraA + extraB)
+        return best
+
+    def getNearest(self, a, positions):
+        """
+        Returns (distance, position) for the position nearest to a, the
+        first one if several are equally near, or (inf, None) if none of
+        them can be reached.
+        """
+        bestDistance, bestPosition = float('inf'), None
+        i = self.index.get(a)
+        for position in positions:
+            j = self.index.get(position)
+            if i is not None and j is not None:
+                distance = self.table[i * self.size + j]
+                if distance == UNREACHABLE: continue
+            else:
+                distance = self.getDistance(a, position)
+            if distance < bestDistance:
+                bestDistance, bestPosition = distance, position
+        return bestDistance, bestPosition
@@ -0,0 +1,178 @@
+# mazeGraph.py
+# ------------
+# A compressed graph of the corridors and junctions of a layout.
+#
+# Most cells of a maze are in corridors, with exactly two open neighbours,
+# so an agent in one can only carry on or turn back. The graph has a node
+# for every other cell (junctions, where there is a choice of way, and
+# dead ends) and an edge for every corridor between two nodes, labelled
+# with its length. Searching it means looking at tens of nodes rather
+# than hundreds of cells, and every corridor keeps the actions that take
+# an agent along it, so a route through the graph can be turned back into
+# the moves that follow it.
+#
+# A graph only depends on the walls of a layout, so it is built once per
+# layout and kept in MEMORY_CACHE by layout hash.
+
+from game import Directions, Actions
+
+# Graphs already built, keyed by layout hash
+MEMORY_CACHE = {}
+
+def getMazeGraph(layout):
+    """
+    Returns the MazeGraph of layout, building it if need be.
+    """
+    key = layout.getContentHash()
+    if key not in MEMORY_CACHE:
+        MEMORY_CACHE[key] = MazeGraph(layout.walls)
+    return MEMORY_CACHE[key]
+
+class Corridor:
+    """
+    The cells between two nodes of a MazeGraph.  actions are the moves
+    that take an agent from the start node to the end node, so length is
+    len(actions), and cells are the cells passed through on the way,
+    not including either node.  A corridor that loops back to the node it
+    started from has the same start and end.
+    """
+    def __init__(self, start, end, actions, cells):
+        self.start = start
+        self.end = end
+        self.actions = actions
+        self.cells = cells
+        self.length = len(actions)
+
+    def getActionsFrom(self, node):
+        """
+        The moves that take an agent along the corridor from node, which
+        must be one of its ends, to the other end.
+        """
+        if node == self.start:
+            return list(self.actions)
+        return [Actions.reverseDirection(action) for action in reversed(self.actions)]
+
+class MazeGraph:
+    """
+    The junctions and dead ends of a walls Grid, and the corridors
+    between them.  Nodes are numbered in column by column order of their
+    cells, and nodes[i] is the cell of node i.  edges[i] lists (action,
+    node, length, corridor) for each way out of node i, in the order of
+    Actions._directionsAsList, where action is the first move, node is
+    the node at the other end of the corridor, length its length and
+    corridor its number in corridors.
+    """
+    def __init__(self, walls):
+        self.width = walls.width
+        self.height = walls.height
+        self.walls = walls
+        self.directions = [d for d, vector in Actions._directionsAsList if d != Directions.STOP]
+
+        self.nodes = []
+        for x in range(self.width):
+            for y in range(self.height):
+                if not walls[x][y] and len(self.getExits((x, y))) != 2:
+                    self.nodes.append((x, y))
+        self.nodeIndex = dict((cell, i) for i, cell in enumerate(self.nodes))
+        self.edges = [[] for node in self.nodes]
+        self.corridors = []
+        # For each cell in a corridor, (corridor number, number of moves
+        # from the start of the corridor)
+        self.corridorIndex = {}
+
+        for node in range(len(self.nodes)):
+            self.addCorridors(node)
+
+        # Loops with no junction on them have no nodes yet, so each is
+        # given one, at its first cell
+        for x in range(self.width):
+            for y in range(self.height):
+                if not walls[x][y] and (x, y) not in self.nodeIndex \
+                   and (x, y) not in self.corridorIndex:
+                    self.nodeIndex[(x, y)] = len(self.nodes)
+                    self.nodes.append((x, y))
+                    self.edges.append([])
+                    self.addCorridors(len(self.nodes) - 1)
+
+    def getExits(self, cell):
+        """
+        The actions that lead from cell to an open neighbour.
+        """
+        x, y = cell
+        exits = []
+        for direction in self.directions:
+            dx, dy = Actions._directions[direction]
+            nextX, nextY = x + dx, y + dy
+            if 0 <= nextX < self.width and 0 <= nextY < self.height and not self.walls[nextX][nextY]:
+                exits.append(direction)
+        return exits
+
+    def step(self, cell, direction):
+        dx, dy = Actions._directions[direction]
+        return cell[0] + dx, cell[1] + dy
+
+    def addCorridors(self, node):
+        """
+        Follows every corridor out of node that has not already been
+        followed from its other end.
+        """
+        for direction in self.getExits(self.nodes[node]):
+            if direction in [edge[0] for edge in self.edges[node]]:
+                continue
+            number = len(self.corridors)
+            cell = self.step(self.nodes[node], direction)
+            actions = [direction]
+            cells = []
+            while cell not in self.nodeIndex:
+                self.corridorIndex[cell] = (number, len(actions))
+                cells.append(cell)
+                back = Actions.reverseDirection(actions[-1])
+                direction = [d for d in self.getExits(cell) if d != back][0]
+                actions.append(direction)
+                cell = self.step(cell, direction)
+            end = self.nodeIndex[cell]
+            corridor = Corridor(node, end, actions, cells)
+            self.corridors.append(corridor)
+            self.edges[node].append((actions[0], end, corridor.length, number))
+            self.edges[end].append((Actions.reverseDirection(actions[-1]), node,
+                                    corridor.length, number))
+        # Keep the exits in the same order as the cell-level actions
+        self.edges[node].sort(key=lambda edge: self.directions.index(edge[0]))
+
+    def isNode(self, cell):
+        return cell in self.nodeIndex
+
+    def getNodesNear(self, cell):
+        """
+        Returns (node, distance, action) for the nodes that can be
+        reached from cell without passing through another node, where
+        action is the first move towards the node.  A node gives just
+        itself, with distance 0 and action Stop; a corridor cell gives
+        the nodes at each end of its corridor.
+        """
+        if cell in self.nodeIndex:
+            return [(self.nodeIndex[cell], 0, Directions.STOP)]
+        number, moves = self.corridorIndex[cell]
+        corridor = self.corridors[number]
+        return [(corridor.start, moves, Actions.reverseDirection(corridor.actions[moves - 1])),
+                (corridor.end, corridor.length - moves, corridor.actions[moves])]
+
+    def getActions(self, route):
+        """
+        Turns a route through the graph, a list of node numbers each of
+        which is joined to the next by a corridor, into the moves that
+        follow it.  Where two nodes are joined by more than one corridor,
+        the shortest is taken.
+        """
+        actions = []
+        for start, end in zip(route, route[1:]):
+            edges = [edge for edge in self.edges[start] if edge[1] == end]
+            if not edges:
+                raise Exception('Nodes %d and %d are not joined by a corridor' % (start, end))
+            action, end, length, number = min(edges, key=lambda edge: edge[2])
+            corridor = self.corridors[number]
+            if corridor.start == start and corridor.actions[0] == action:
+                actions.extend(corridor.actions)
+            else:
+                actions.extend(corridor.getActionsFrom(corridor.end))
+        return actions
@@ -33,16 +33,71 @@ import random
 import game
 import util
 import sys
+import time
+import mdpSolvers
+import transitionModel
 
 class MDPAgent(Agent):
 
+    # Constructor
+    #
+    # solver picks the backend used to find the policy:
+    #
+    # dict:  policy iteration over dictionaries of locations (default)
+    # numpy: the same policy iteration over numpy arrays, which is much
+    #        faster on big layouts. Select with -a solver=numpy
+    # warm:  value iteration that starts from the previous move's
+    #        utilities and only sweeps outwards from the rewards that
+    #        have changed, until no residual is above tolerance.
+    #        Select with -a solver=warm,tolerance=0.001
+    #
+    # The other arguments control how long each move is allowed to take:
+    #
+    # epsilon:    if positive, policy evaluation stops as soon as the
+    #             utilities are guaranteed to be within epsilon of their
+    #             true values, rather than after a fixed ITERATION_LIMIT
+    #             sweeps.
+    # timeBudget: if positive, the most seconds to spend on one move.
+    #             When it runs out, the best policy found so far is used.
+    # stats:      if set, print a summary of the per-move stats (kept in
+    #             moveStats) at the end of each game.
+    #
+    # radius: if positive, the dict solver only solves the MDP over the
+    #         locations within radius steps of Pacman, with the
+    #         locations just outside given a fixed estimate of their
+    #         utility. The cost of a move then depends on the radius
+    #         rather than on the size of the layout.
+    # mazeDistance: if set, those estimates use the distance to the
+    #         nearest food through the maze rather than the manhattan
+    #         distance.
+    def __init__(self, solver='dict', tolerance=0.001, epsilon=0, timeBudget=0, stats=False, radius=0,
+                 mazeDistance=False):
+        if solver not in ['dict', 'numpy', 'warm']:
+            raise Exception("Unknown MDP solver: " + str(solver))
+        self.radius = int(radius)
+        if self.radius > 0 and solver != 'dict':
+            raise Exception("Only the dict solver supports a local radius")
+        self.solver = solver
+        self.tolerance = float(tolerance)
+        self.epsilon = float(epsilon)
+        self.timeBudget = float(timeBudget)
+        # Agent arguments arrive from the command line as strings
+        self.showStats = str(stats).lower() not in ['0', 'false', '']
+        self.useMazeDistance = str(mazeDistance).lower() not in ['0', 'false', '']
+        # Set by getAction() when there is a time budget
+        self.deadline = None
+
     def registerInitialState(self, state):
-        self.walls = api.walls(state)
-        # Dictionary of locations that aren't walls
-        self.nonWalls = self.getNonWalls(state)
+        # Transition model for this layout, shared between games
+        self.model = transitionModel.getTransitionModel(state)
+        self.walls = self.model.walls
+        # List of locations that aren't walls
+        self.nonWalls = self.model.cells
         # Constants for policy iteration
         self.GAMMA = 0.5
         self.ITERATION_LIMIT = 20
+        # Upper limit on sweeps when evaluating to within epsilon
+        self.MAX_SWEEPS = 1000
         self.ACTIONS = ["North", "East", "South", "West"]
         # Constants for rewards
         self.FOOD = 10
@@ -50,51 +105,29 @@ class MDPAgent(Agent):
         self.GHOST = -100
         self.GHOST_ZONE = -50
         self.EMPTY = -1
+        if self.solver == 'numpy':
+            self.numpySolver = mdpSolvers.NumpySolver(self.model, self.GAMMA, self.ITERATION_LIMIT,
+                                                      self.epsilon, self.MAX_SWEEPS)
+        elif self.solver == 'warm':
+            self.warmSolver = mdpSolvers.PrioritizedSweepingSolver(self.model, self.GAMMA, self.tolerance)
+        # True distances through the maze, if they are being used
+        self.mazeDistances = None
+        if self.useMazeDistance:
+            self.mazeDistances = state.data.layout.getMazeDistances()
+        # One dictionary of stats (sweeps, residual, time...) per move
+        self.moveStats = []
         # Initialises reward, values (utilities) and policies dictionaries
         self.updateMap(state)
 
-    # Returns dictionary of non wall locations
-    def getNonWalls(self, state):
-        nonWalls = []
-        (x, y) = self.calcLayoutBounds(state)
-        for i in range(x):
-            for j in range(y):
-                if (i, j) not in self.walls:
-                    nonWalls.append((i, j))
-        return nonWalls
-
-    # Returns width and height of game grid
-    def calcLayoutBounds(self, state):
-        corners = api.corners(state)
-        height = self.getLayoutHeight(corners)
-        width  = self.getLayoutWidth(corners)
-        return (width, height)
-
-    # This code has been taken from mapAgents.py
-    # Which was provided as a solution to practical
-    # 05 of the AI module
-    def getLayoutHeight(self, corners):
-        height = -1
-        for i in range(len(corners)):
-            if corners[i][1] > height:
-                height = corners[i][1]
-        return height + 1
-
-    # This code has been taken from mapAgents.py
-    # Which was provided as a solution to practical
-    # 05 of the AI module
-    def getLayoutWidth(self, corners):
-        width = -1
-        for i in range(len(corners)):
-            if corners[i][0] > width:
-                width = corners[i][0]
-        return width + 1
-
-    # Updates the reward dictionary
-    def updateRewards(self, food, capsules, ghosts):
+    # Updates the reward dictionary for the given locations
+    def updateRewards(self, food, capsules, ghosts, locations):
         self.rewards = {}
+        # Sets, so that each test below is a single lookup
+        food = set(food)
+        capsules = set(capsules)
+        ghosts = set(ghosts)
         # For all locations that are not walls
-        for i in self.nonWalls:
+        for i in locations:
             # If location contains food
             if i in food:
                 self.rewards[i] = self.FOOD
@@ -112,8 +145,8 @@ class MDPAgent(Agent):
         # The zone 1 manhattan distance away from the ghost
         # This is done after the ghosts, food, capsules and empty space
         # To prevent the zone being overwritten
-        for i in self.nonWalls:
-            if i in ghosts:
+        for i in ghosts:
+            if i in self.rewards:
                 (x, y) = i
                 (n, e, s, w) = self.getSurroundingLocations(x, y)
                 if n in self.rewards:
@@ -126,12 +159,48 @@ class MDPAgent(Agent):
                     self.rewards[w] = self.GHOST_ZONE
 
     # Reset utility dictionary to all zeros
-    def resetValues(self):
-        self.values = dict.fromkeys(self.nonWalls, 0)
+    def resetValues(self, locations):
+        self.values = dict.fromkeys(locations, 0)
 
     # Reset policies dictionary. North for example
-    def resetPolicy(self):
-        self.policy = dict.fromkeys(self.nonWalls, 'North')
+    def resetPolicy(self, locations):
+        self.policy = dict.fromkeys(locations, 'North')
+
+    # Returns the locations within self.radius steps of pacman, in the
+    # order a breadth first search reaches them, and the boundary: the
+    # locations exactly one step further away.
+    def getLocalRegion(self, pacman):
+        region = []
+        boundary = []
+        distances = {pacman: 0}
+        queue = util.Queue()
+        queue.push(pacman)
+        while not queue.isEmpty():
+            current = queue.pop()
+            if distances[current] > self.radius:
+                boundary.append(current)
+                continue
+            region.append(current)
+            for next in self.getSurroundingLocations(current[0], current[1]):
+                if next not in self.walls and next not in distances:
+                    distances[next] = distances[current] + 1
+                    queue.push(next)
+        return region, boundary
+
+    # Give the boundary of a local region fixed utilities that stand in
+    # for the rest of the board. Locations that are, or are next to, a
+    # ghost keep their (negative) reward. Otherwise the estimate is the
+    # discounted reward for the nearest food.
+    def setBoundaryValues(self, boundary, food):
+        for i in boundary:
+            if self.rewards[i] < self.EMPTY:
+                self.values[i] = self.rewards[i]
+            elif len(food) > 0:
+                if self.mazeDistances:
+                    distance = self.mazeDistances.getNearest(i, food)[0]
+                else:
+                    distance = min([util.manhattanDistance(i, f) for f in food])
+                self.values[i] = self.FOOD * self.GAMMA ** distance
 
     # Returns N, E, S, W positions from given position
     def getSurroundingLocations(self, x, y):
@@ -142,27 +211,9 @@ class MDPAgent(Agent):
         return (n, e, s, w)
 
     # Calculates expected utility of a given action at a given position
+    # If a move results in a wall, Pacman stays in the original position
     def expectedUtility(self, x, y, action):
-        current = (x,y)
-        (nLoc, eLoc, sLoc, wLoc) = self.getSurroundingLocations(x, y)
-
-        # If move results to a wall, stay in original position
-        # Retrieve utilities for N, E, S, W locations
-        currentValue = self.values[current]
-        nValue = self.values[nLoc] if nLoc not in self.walls else currentValue
-        eValue = self.values[eLoc] if eLoc not in self.walls else currentValue
-        sValue = self.values[sLoc] if sLoc not in self.walls else currentValue
-        wValue = self.values[wLoc] if wLoc not in self.walls else currentValue
-
-        # Apply the transition function to determine expected utility
-        if action == 'North':
-            return 0.8 * nValue + 0.1 * eValue + 0.1 * wValue
-        elif action == 'East':
-            return 0.8 * eValue + 0.1 * nValue + 0.1 * sValue
-        elif action == 'South':
-            return 0.8 * sValue + 0.1 * eValue + 0.1 * wValue
-        else:
-            return 0.8 * wValue + 0.1 * nValue + 0.1 * sValue
+        return self.model.expectedUtility(self.values, (x, y), action)
 
     # Returns action that maximises utility
     # Given list of utlities [N, E, S, W]
@@ -170,14 +221,24 @@ class MDPAgent(Agent):
         i = utils.index(max(utils))
         return self.ACTIONS[i]
 
+    # True if the time budget for this move has been used up
+    def outOfTime(self):
+        return self.deadline is not None and time.time() > self.deadline
+
     # Updates policy dictionary with optimum evaluated policy
+    #
+    # Stops early, keeping the latest improved policy, if the time
+    # budget runs out. At least one round of improvement is always made.
     def policyIteration(self):
+        self.sweeps = 0
+        self.iterations = 0
+        self.converged = False
         while True:
             # Evaluate current policy
             self.policyEval()
             same = True
             # For every value in utlity dictionary
-            for k in self.values:
+            for k in self.states:
                 # Determine the action, a,  that maximises utlity
                 expectedUtilities = []
                 for action in self.ACTIONS:
@@ -188,32 +249,101 @@ class MDPAgent(Agent):
                     # Update the policy
                     self.policy[k] = a
                     same = False
+            self.iterations += 1
             # Stop iterating, policy has converged
-            if same: return
+            if same:
+                self.converged = True
+                return
+            if self.outOfTime(): return
 
     # Evaluate a given policy
     # Used by policy iteration
+    #
+    # Records the residual, the largest change to any utility in the
+    # last sweep. If the residual is at most epsilon * (1 - gamma) /
+    # gamma then the utilities are within epsilon of the true ones.
     def policyEval(self):
+        if self.epsilon > 0:
+            limit = self.MAX_SWEEPS
+        else:
+            limit = self.ITERATION_LIMIT
         # Implementation of policy evaluation formula from lecture slides
-        for i in range(self.ITERATION_LIMIT):
-            for k in self.values:
+        for i in range(limit):
+            self.residual = 0
+            for k in self.states:
+                old = self.values[k]
                 self.values[k] = self.rewards[k] + self.GAMMA * self.expectedUtility(k[0], k[1], self.policy[k])
+                if abs(self.values[k] - old) > self.residual:
+                    self.residual = abs(self.values[k] - old)
+            self.sweeps += 1
+            if self.epsilon > 0 and self.residual <= self.epsilon * (1 - self.GAMMA) / self.GAMMA:
+                return
+            if self.outOfTime(): return
 
     # Before each move, update state of rewards
     # To reflect the state of the game
     # And reset the utilities and policies dictionary
     # To prepare for policy iteration
+    #
+    # self.states holds the locations that policy iteration solves for:
+    # every non-wall location, or just the local region around Pacman.
     def updateMap(self, state):
-        self.updateRewards(api.food(state), api.capsules(state), api.ghosts(state))
-        self.resetValues()
-        self.resetPolicy()
+        food = api.food(state)
+        if self.radius > 0:
+            (self.states, boundary) = self.getLocalRegion(api.whereAmI(state))
+            locations = self.states + boundary
+        else:
+            locations = self.nonWalls
+        self.updateRewards(food, api.capsules(state), api.ghosts(state), locations)
+        self.resetValues(locations)
+        self.resetPolicy(locations)
+        if self.radius > 0:
+            self.setBoundaryValues(boundary, food)
+        else:
+            self.states = list(self.values)
 
     # Makes the best move according to the optimum evaluated policy
     # Determined by policy iteration
     def getAction(self, state):
+        start = time.time()
+        if self.timeBudget > 0:
+            self.deadline = start + self.timeBudget
+        else:
+            self.deadline = None
         self.updateMap(state)
-        self.policyIteration()
+        if self.solver == 'numpy':
+            self.policy = self.numpySolver.solve(self.rewards, self.deadline)
+            stats = {'sweeps': self.numpySolver.sweeps,
+                     'iterations': self.numpySolver.iterations,
+                     'residual': self.numpySolver.residual,
+                     'converged': self.numpySolver.converged}
+        elif self.solver == 'warm':
+            self.policy = self.warmSolver.solve(self.rewards, self.deadline)
+            stats = {'backups': self.warmSolver.backups,
+                     'sweeps': self.warmSolver.sweeps,
+                     'residual': self.warmSolver.residual,
+                     'converged': self.warmSolver.converged}
+        else:
+            self.policyIteration()
+            stats = {'sweeps': self.sweeps,
+                     'iterations': self.iterations,
+                     'residual': self.residual,
+                     'converged': self.converged}
+        stats['time'] = time.time() - start
+        self.moveStats.append(stats)
         pacman = api.whereAmI(state)
         legal = api.legalActions(state)
         move = self.policy[pacman]
-        return api.makeMove(move, legal)
\ No newline at end of file
+        return api.makeMove(move, legal)
+
+    # Summarise the per-move stats at the end of the game
+    def final(self, state):
+        if not self.showStats or len(self.moveStats) == 0:
+            return
+        moves = len(self.moveStats)
+        print "MDP solver stats over %d moves:" % moves
+        print "  mean sweeps:   %.2f" % (sum([m['sweeps'] for m in self.moveStats]) / float(moves))
+        print "  max residual:  %g" % max([m['residual'] for m in self.moveStats])
+        print "  mean time:     %.4fs" % (sum([m['time'] for m in self.moveStats]) / moves)
+        print "  max time:      %.4fs" % max([m['time'] for m in self.moveStats])
+        print "  not converged: %d" % len([m for m in self.moveStats if not m['converged']])
@@ -0,0 +1,234 @@
+# mdpSolvers.py
+#
+# Alternative solver backends for the MDPAgent in mdpAgents.py.
+#
+# These solve exactly the same MDP as the dictionary based code in
+# mdpAgents.py (same rewards, discount factor and 0.8/0.1/0.1 motion
+# model, where a move into a wall leaves Pacman where it is), but
+# store it in a form that is much quicker to sweep over.
+
+import heapq
+import time
+
+# numpy is optional. Only the solvers that need it will complain if it
+# is not installed.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from transitionModel import ACTIONS, INTENDED, SIDE
+
+#
+# Policy iteration over dense numpy arrays.
+#
+# Every non-wall cell is numbered as in the transition model, and the
+# rewards and utilities are held in arrays indexed by that number. The
+# three possible outcomes of each action are unpacked from the model
+# into arrays of neighbour indices, so a whole Bellman sweep is a
+# handful of array operations rather than a Python loop over cells.
+#
+# Termination follows MDPAgent: a fixed iterationLimit sweeps of policy
+# evaluation, or if epsilon is positive, sweeps until the residual
+# guarantees the utilities are within epsilon (up to maxSweeps).
+#
+class NumpySolver:
+
+    def __init__(self, model, gamma, iterationLimit, epsilon=0, maxSweeps=1000):
+        if numpy is None:
+            raise Exception("The numpy solver needs numpy to be installed")
+        self.gamma = gamma
+        self.iterationLimit = iterationLimit
+        self.epsilon = epsilon
+        self.maxSweeps = maxSweeps
+        self.cells = model.cells
+        self.index = model.index
+
+        # Every row of the model has the intended move followed by the
+        # two perpendicular ones. main[a, i] is the index of the cell
+        # reached by the intended move of action ACTIONS[a] from cell i.
+        n = len(self.cells)
+        outcomes = numpy.array(model.indices, dtype=numpy.intp).reshape(n, 4, 3)
+        self.main = outcomes[:, :, 0].T.copy()
+        self.firstSide = outcomes[:, :, 1].T.copy()
+        self.secondSide = outcomes[:, :, 2].T.copy()
+        self.cellRange = numpy.arange(n)
+
+    # Expected utility of every action in every cell, as a 4 x n array
+    def expectedUtilities(self, values):
+        return (INTENDED * values[self.main] + SIDE * values[self.firstSide]
+                + SIDE * values[self.secondSide])
+
+    # Evaluate the policy (an array of action indices) in place of
+    # MDPAgent.policyEval()
+    def policyEval(self, rewards, values, policy, deadline):
+        main = self.main[policy, self.cellRange]
+        firstSide = self.firstSide[policy, self.cellRange]
+        secondSide = self.secondSide[policy, self.cellRange]
+        if self.epsilon > 0:
+            limit = self.maxSweeps
+        else:
+            limit = self.iterationLimit
+        for i in range(limit):
+            old = values
+            values = rewards + self.gamma * (INTENDED * values[main] + SIDE * values[firstSide]
+                                             + SIDE * values[secondSide])
+            self.residual = abs(values - old).max()
+            self.sweeps += 1
+            if self.epsilon > 0 and self.residual <= self.epsilon * (1 - self.gamma) / self.gamma:
+                break
+            if deadline is not None and time.time() > deadline:
+                break
+        return values
+
+    # Run policy iteration for the given reward dictionary, starting
+    # from all zero utilities and an all North policy, just like
+    # MDPAgent.policyIteration(). Returns the policy as a dictionary
+    # from location to action.
+    #
+    # If deadline (a time.time() value) passes, the latest improved
+    # policy is returned.
+    def solve(self, rewards, deadline=None):
+        rewards = numpy.array([rewards[cell] for cell in self.cells], dtype=float)
+        values = numpy.zeros(len(self.cells))
+        policy = numpy.zeros(len(self.cells), dtype=numpy.intp)
+        self.sweeps = 0
+        self.iterations = 0
+        self.converged = False
+        while True:
+            values = self.policyEval(rewards, values, policy, deadline)
+            # argmax picks the first of any tied actions, as
+            # MDPAgent.argmax() does
+            improved = self.expectedUtilities(values).argmax(axis=0)
+            self.iterations += 1
+            if (improved == policy).all():
+                self.converged = True
+                break
+            policy = improved
+            if deadline is not None and time.time() > deadline:
+                break
+        self.values = values
+        return dict((cell, ACTIONS[a]) for cell, a in zip(self.cells, policy))
+
+#
+# Warm-started value iteration by prioritized sweeping.
+#
+# Between two moves only a few rewards change (a piece of food eaten,
+# the ghosts moving a step), so rather than starting again from zero the
+# solver keeps the utilities and policy from the previous move. Only the
+# states whose reward changed are queued, and Bellman backups then
+# spread outwards from them, largest residual first, through the
+# predecessors of every state that is updated. Solving stops once no
+# state has a residual above tolerance.
+#
+class PrioritizedSweepingSolver:
+
+    def __init__(self, model, gamma, tolerance):
+        if tolerance <= 0:
+            raise Exception("The sweeping tolerance must be positive")
+        self.gamma = gamma
+        self.tolerance = tolerance
+        self.cells = model.cells
+        n = len(self.cells)
+
+        # outcomes[s][a] lists the intended and the two perpendicular
+        # states reached by action a from state s
+        self.outcomes = []
+        for s in range(n):
+            self.outcomes.append([[j for j, p in model.successors(s, a)] for a in range(4)])
+        # predecessors[s] lists the states whose utility depends on s
+        self.predecessors = [set() for s in range(n)]
+        for s in range(n):
+            for moves in self.outcomes[s]:
+                for j in moves:
+                    self.predecessors[j].add(s)
+
+        self.values = None
+        self.rewards = None
+        self.policy = dict.fromkeys(self.cells, 'North')
+        # States still above tolerance when the last call to solve()
+        # ran out of time, which the next call starts from along with
+        # the states whose reward changed
+        self.unfinished = set()
+        # Work done by the last call to solve(). residual is the largest
+        # residual seen that was left below tolerance.
+        self.backups = 0
+        self.sweeps = 0
+        self.residual = 0
+        self.converged = True
+
+    # Returns the Bellman backup of state s, and the action that
+    # achieves it (the first one, if several are tied).
+    def backup(self, s):
+        values = self.values
+        best = None
+        for a in range(4):
+            main, firstSide, secondSide = self.outcomes[s][a]
+            utility = INTENDED * values[main] + SIDE * values[firstSide] + SIDE * values[secondSide]
+            if best is None or utility > best:
+                best = utility
+                bestAction = a
+        return self.rewards[s] + self.gamma * best, bestAction
+
+    # Work out the residual of state s, and queue it if it is above the
+    # tolerance. Also keeps the policy of s up to date, since its
+    # expected utilities have to be computed anyway.
+    def queueState(self, queue, pending, s):
+        value, action = self.backup(s)
+        self.policy[self.cells[s]] = ACTIONS[action]
+        residual = abs(value - self.values[s])
+        if residual <= self.tolerance:
+            self.residual = max(self.residual, residual)
+        elif residual > pending.get(s, 0):
+            pending[s] = residual
+            heapq.heappush(queue, (-residual, s))
+
+    # Update the utilities for the given reward dictionary, and return
+    # the policy as a dictionary from location to action.
+    #
+    # If deadline (a time.time() value) passes, sweeping stops and the
+    # current policy is returned. The states still queued are kept in
+    # unfinished, and are queued again by the next call.
+    def solve(self, rewards, deadline=None):
+        rewards = [rewards[cell] for cell in self.cells]
+        if self.values is None:
+            # Nothing to start from, so every state has changed
+            self.values = [0] * len(self.cells)
+            changed = range(len(self.cells))
+        else:
+            changed = [s for s in range(len(self.cells))
+                       if rewards[s] != self.rewards[s] or s in self.unfinished]
+        self.rewards = rewards
+
+        # queue is a heap of (-residual, state). pending holds the
+        # residual each queued state was last pushed with, so that stale
+        # heap entries can be skipped.
+        queue = []
+        pending = {}
+        self.residual = 0
+        for s in changed:
+            self.queueState(queue, pending, s)
+
+        self.backups = 0
+        self.converged = True
+        self.unfinished = set()
+        while queue:
+            if deadline is not None and time.time() > deadline:
+                # The queue may only hold stale entries, in which case
+                # there is nothing left to do
+                if pending:
+                    self.converged = False
+                    self.residual = max(self.residual, max(pending.values()))
+                    self.unfinished = set(pending)
+                break
+            residual, s = heapq.heappop(queue)
+            if pending.get(s) != -residual:
+                continue
+            del pending[s]
+            self.values[s], action = self.backup(s)
+            self.policy[self.cells[s]] = ACTIONS[action]
+            self.backups += 1
+            for p in self.predecessors[s]:
+                self.queueState(queue, pending, p)
+        self.sweeps = float(self.backups) / len(self.cells)
+        return self.policy
@@ -46,7 +46,8 @@ from game import Actions
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
-import sys, types, time, random, os
+import sys, types, time, random, os, itertools
+from collections import OrderedDict
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
@@ -73,12 +74,58 @@ class GameState:
 
     # static variable keeps track of which states have had getLegalActions called
     explored = set()
+
+    # How explored is kept, set with setExploredTracking:
+    #   'full'  - every state is kept (the default)
+    #   'lru'   - only the exploredLimit most recently seen states are kept
+    #   'count' - no states are kept, just exploredCount
+    #   'off'   - no tracking at all
+    # exploredCount counts the states added in every mode except 'off'.
+    exploredMode = 'full'
+    exploredLimit = None
+    exploredCount = 0
+    EXPLORED_MODES = ['full', 'lru', 'count', 'off']
+
+    def setExploredTracking(mode, limit=None):
+        """
+        Changes how GameState.explored is kept (see exploredMode above),
+        and resets it.  limit is required for 'lru' mode.
+        """
+        if mode not in GameState.EXPLORED_MODES:
+            raise Exception('Unknown explored tracking mode: ' + str(mode))
+        if mode == 'lru' and not limit:
+            raise Exception('lru explored tracking needs a limit')
+        GameState.exploredMode = mode
+        GameState.exploredLimit = limit
+        GameState.getAndResetExplored()
+    setExploredTracking = staticmethod(setExploredTracking)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        if GameState.exploredMode == 'lru':
+            tmp = set(GameState.explored)
+            GameState.explored = OrderedDict()
+        else:
+            tmp = GameState.explored.copy()
+            GameState.explored = set()
+        GameState.exploredCount = 0
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def addExplored(state):
+        mode = GameState.exploredMode
+        if mode == 'off': return
+        GameState.exploredCount += 1
+        if mode == 'full':
+            GameState.explored.add(state)
+        elif mode == 'lru':
+            explored = GameState.explored
+            if state in explored:
+                del explored[state]
+            explored[state] = True
+            if len(explored) > GameState.exploredLimit:
+                explored.popitem(last=False)
+    addExplored = staticmethod(addExplored)
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
@@ -112,7 +159,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.getWritableAgentState(agentIndex) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -120,8 +167,9 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        state.data.updateZobrist( self.data )
+        GameState.addExplored(self)
+        GameState.addExplored(state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -174,6 +222,10 @@ class GameState:
         return self.data.capsules
 
     def getNumFood( self ):
+        """
+        Returns the amount of food left.  This is kept up to date by the food
+        grid as food is eaten, so is quick to call.
+        """
         return self.data.food.count()
 
     def getFood(self):
@@ -231,6 +283,18 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def readOnlyCopy( self ):
+        """
+        Returns a copy of this state to give to an agent.  The agent can
+        generate successors of it as usual.  Its food grid is a frozen
+        copy and its layout is read-only, so the copy is cheaper to make
+        than deepCopy, and nothing else is shared with the real game, so
+        the agent cannot change the real game through it.
+        """
+        state = GameState( self )
+        state.data = self.data.readOnlyCopy()
+        return state
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -330,8 +394,16 @@ class PacmanRules:
     def getLegalActions( state ):
         """
         Returns a list of possible actions.
+
+        On a whole cell they are looked up in the legal action table of the
+        layout.  The table holds tuples, so the list is always a new one.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        conf = state.getPacmanState().configuration
+        layout = state.data.layout
+        if layout.legalActions == None: layout.initializeLegalActions()
+        legal = layout.legalActions.get( conf.pos )
+        if legal != None: return list( legal )
+        return Actions.getPossibleActions( conf, layout.walls )
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action ):
@@ -342,7 +414,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.getWritableAgentState(0)
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -364,18 +436,19 @@ class PacmanRules:
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            # The food grid counts the food left as it is eaten
+            if state.getNumFood() == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
+            # The capsule list may be shared with the previous state
+            state.data.capsules = state.data.capsules[:]
             state.data.capsules.remove( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.getWritableAgentState(index).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -389,7 +462,11 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
-        possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+        layout = state.data.layout
+        if layout.legalGhostActions == None: layout.initializeLegalActions()
+        legal = layout.legalGhostActions.get( (conf.pos, conf.direction) )
+        if legal != None: return list( legal )
+        possibleActions = Actions.getPossibleActions( conf, layout.walls )
         reverse = Actions.reverseDirection( conf.direction )
         if Directions.STOP in possibleActions:
             possibleActions.remove( Directions.STOP )
@@ -404,7 +481,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.getWritableAgentState(ghostIndex)
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -425,12 +502,12 @@ class GhostRules:
                 ghostState = state.data.agentStates[index]
                 ghostPosition = ghostState.configuration.getPosition()
                 if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                    GhostRules.collide( state, ghostState, index )
+                    GhostRules.collide( state, state.data.getWritableAgentState(index), index )
         else:
             ghostState = state.data.agentStates[agentIndex]
             ghostPosition = ghostState.configuration.getPosition()
             if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                GhostRules.collide( state, ghostState, agentIndex )
+                GhostRules.collide( state, state.data.getWritableAgentState(agentIndex), agentIndex )
     checkDeath = staticmethod( checkDeath )
 
     def collide( state, ghostState, agentIndex):
@@ -439,6 +516,7 @@ class GhostRules:
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -503,6 +581,8 @@ def readCommand( argv ):
     parser.add_option('-g', '--ghosts', dest='ghost',
                       help=default('the ghost agent TYPE in the ghostAgents module to use'),
                       metavar = 'TYPE', default='RandomGhost')
+    parser.add_option('--ghostArgs', dest='ghostArgs',
+                      help='Comma separated values sent to the ghosts. e.g. "mazeDistance"')
     parser.add_option('-k', '--numghosts', type='int', dest='numGhosts',
                       help=default('The maximum number of ghosts to use'), default=4)
     parser.add_option('-z', '--zoom', type='float', dest='zoom',
@@ -511,8 +591,16 @@ def readCommand( argv ):
                       help='Fixes the random seed to always play the same game', default=False)
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
+    parser.add_option('--recordLog', dest='recordLog', metavar='FILE',
+                      help='Appends game histories to a compact game log FILE', default=None)
+    parser.add_option('--snapshotInterval', dest='snapshotInterval', type='int', metavar='MOVES',
+                      help=default('How often to store a snapshot of the state in a game log (0 for never)'), default=50)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file (pickle or game log) to replay', default=None)
+    parser.add_option('--replayGame', dest='replayGame', type='int',
+                      help=default('Which game of a game log to replay, counting from 0'), default=0)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int', metavar='MOVE',
+                      help=default('The move to start showing a replay from'), default=0)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -521,8 +609,19 @@ def readCommand( argv ):
                       help=default('Time to delay between frames; <0 means keyboard'), default=0.1)
     parser.add_option('-c', '--catchExceptions', action='store_true', dest='catchExceptions',
                       help='Turns on exception handling and timeouts during games', default=False)
-    parser.add_option('--timeout', dest='timeout', type='int',
-                      help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--timeout', dest='timeout', type='float',
+                      help=default('Maximum length of time, in seconds (fractions allowed), an agent can spend computing in a single game'), default=30)
+    parser.add_option('--explored', dest='explored', type='choice', choices=GameState.EXPLORED_MODES,
+                      help=default('How to track explored states: full, lru, count or off'), default='full')
+    parser.add_option('--exploredLimit', dest='exploredLimit', type='int',
+                      help=default('Number of states kept by --explored lru'), default=10000)
+    parser.add_option('--fast', action='store_true', dest='fast',
+                      help='Plays games with a quicker loop that trusts the agents (needs -q)', default=False)
+    parser.add_option('--results', dest='results',
+                      help='Writes a record of each game to a file as it finishes (CSV if it ends in .csv, otherwise JSON lines)',
+                      metavar='FILE', default=None)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes to play games in parallel (0 plays them all here)'), default=0)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -532,6 +631,9 @@ def readCommand( argv ):
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    # Explored state bookkeeping
+    GameState.setExploredTracking(options.explored, options.exploredLimit)
+
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
@@ -553,7 +655,8 @@ def readCommand( argv ):
 
     # Choose a ghost agent
     ghostType = loadAgent(options.ghost, noKeyboard)
-    args['ghosts'] = [ghostType( i+1 ) for i in range( options.numGhosts )]
+    ghostOpts = parseAgentArgs(options.ghostArgs)
+    args['ghosts'] = [ghostType( i+1, **ghostOpts ) for i in range( options.numGhosts )]
 
     # Choose a display format
     if options.quietGraphics:
@@ -568,17 +671,39 @@ def readCommand( argv ):
         args['display'] = graphicsDisplay.PacmanGraphics(options.zoom, frameTime = options.frameTime)
     args['numGames'] = options.numGames
     args['record'] = options.record
+    args['recordLog'] = options.recordLog
+    args['snapshotInterval'] = options.snapshotInterval
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['results'] = options.results
+    if options.fast:
+        if not options.quietGraphics: raise Exception('--fast only works with -q')
+        args['fast'] = True
+
+    # Parallel games: each worker process builds its own agents from the
+    # same arguments, and every game gets its own seed taken from here
+    if options.workers > 0:
+        args['workers'] = options.workers
+        args['baseSeed'] = random.randint(0, 2**31 - 1)
+        args['agentSpec'] = {'layout': options.layout, 'pacman': options.pacman,
+                             'agentOpts': agentOpts, 'ghost': options.ghost, 'ghostOpts': ghostOpts,
+                             'numGhosts': options.numGhosts,
+                             'explored': options.explored,
+                             'exploredLimit': options.exploredLimit}
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print 'Replaying recorded game %s.' % options.gameToReplay
+        import gameLog
+        if gameLog.isGameLog(options.gameToReplay):
+            replayLoggedGame(options.gameToReplay, options.replayGame, options.replayFrom, args['display'])
+            sys.exit(0)
         import cPickle
         f = open(options.gameToReplay)
         try: recorded = cPickle.load(f)
         finally: f.close()
         recorded['display'] = args['display']
+        recorded['startMove'] = options.replayFrom
         replayGame(**recorded)
         sys.exit(0)
 
@@ -607,12 +732,24 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def replayGame( layout, actions, display ):
+def replayGame( layout, actions, display, numGhosts=None, startMove=0, startState=None ):
+    """
+    Shows a game being played out from its actions.  The first startMove
+    actions are applied without being shown, unless startState (the state
+    after them) is given, in which case actions should start after them.
+    """
     import pacmanAgents, ghostAgents
+    if numGhosts == None: numGhosts = layout.getNumGhosts()
     rules = ClassicGameRules()
-    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(layout.getNumGhosts())]
+    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(numGhosts)]
     game = rules.newGame( layout, agents[0], agents[1:], display )
     state = game.state
+    actions = iter(actions)
+    if startState != None:
+        state = startState
+    else:
+        for action in itertools.islice(actions, startMove):
+            state = state.generateSuccessor( *action )
     display.initialize(state.data)
 
     for action in actions:
@@ -625,12 +762,38 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def replayLoggedGame( filename, gameNumber, startMove, display ):
+    """
+    Replays game gameNumber of a game log, showing it from move startMove
+    on.  The state at startMove is rebuilt from the snapshot before it, so
+    only the moves after that are read from the log.
+    """
+    import gameLog
+    log = gameLog.GameLogReader(filename)
+    try:
+        header = log.getGame(gameNumber)
+        startState = log.getState(gameNumber, min(startMove, header['numMoves']))
+        replayGame( log.getLayout(gameNumber), log.iterMoves(gameNumber, startMove), display,
+                    header['numAgents'] - 1, startState=startState )
+    finally:
+        log.close()
+
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30,
+              workers=0, agentSpec=None, baseSeed=0, results=None, fast=False, recordLog=None,
+              snapshotInterval=0 ):
+    if workers > 0:
+        return runParallelGames( layout, agentSpec, workers, baseSeed, numGames, record,
+                                 numTraining, catchExceptions, timeout, results, fast, recordLog,
+                                 snapshotInterval )
+
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
-    games = []
+    summary = GameResults(results)
+    if recordLog != None:
+        import gameLog
+        log = gameLog.GameLogWriter(recordLog, snapshotInterval)
 
     for i in range( numGames ):
         beQuiet = i < numTraining
@@ -643,27 +806,192 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
             gameDisplay = display
             rules.quiet = False
         game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
-        if not beQuiet: games.append(game)
+        if fast: game.runFast()
+        else: game.run()
+        # Only a record of the game is kept, not the game itself
+        if not beQuiet: summary.add(gameRecord(game, i))
+
+        if record: recordGame( layout, game.moveHistory, i )
+        if recordLog != None: log.addGame( layout, game.moveHistory, len(game.agents) )
+
+    summary.close()
+    if recordLog != None: log.close()
+    if (numGames-numTraining) > 0:
+        summary.printSummary()
+
+    return summary
 
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+def gameRecord( game, i, seed=None ):
+    """
+    A small record of how game number i went. seed is the seed the game
+    was played with, if it had one of its own.
+    """
+    return {'game': i, 'seed': seed, 'score': game.state.getScore(), 'win': game.state.isWin(),
+            'moves': len(game.moveHistory), 'agentTime': game.totalAgentTimes[0]}
+
+class GameResults:
+    """
+    Running totals over the games played by runGames(), updated as each
+    game finishes.
+
+    If a file name is given, the record of each game is written to it
+    straight away, as CSV if the name ends in .csv and as one JSON object
+    per line otherwise. The per-game scores are then left in the file
+    rather than kept in memory, so any number of games can be played.
+    """
+    FIELDS = ['game', 'seed', 'score', 'win', 'moves', 'agentTime']
+
+    def __init__( self, filename=None ):
+        self.filename = filename
+        self.numGames = 0
+        self.totalScore = 0
+        self.wins = 0
+        self.agentTime = 0
+        self.scores = []
+        self.record = []
+        self.file = None
+        if filename != None:
+            self.file = open(filename, 'w')
+            if filename.endswith('.csv'):
+                import csv
+                self.writer = csv.DictWriter(self.file, self.FIELDS)
+                self.file.write(','.join(self.FIELDS) + '\n')
+            else:
+                self.writer = None
+
+    def add( self, result ):
+        self.numGames += 1
+        self.totalScore += result['score']
+        self.wins += int(result['win'])
+        self.agentTime += result['agentTime']
+        if self.file == None:
+            self.scores.append(result['score'])
+            self.record.append(result['win'])
+        elif self.writer != None:
+            self.writer.writerow(result)
+        else:
+            import json
+            self.file.write(json.dumps(result, sort_keys=True) + '\n')
+
+    def close( self ):
+        if self.file != None:
+            self.file.close()
+
+    def getAverageScore( self ):
+        return self.totalScore / float(self.numGames)
+
+    def getWinRate( self ):
+        return self.wins / float(self.numGames)
+
+    def printSummary( self ):
+        print 'Average Score:', self.getAverageScore()
+        if self.file == None:
+            print 'Scores:       ', ', '.join([str(score) for score in self.scores])
+        else:
+            print 'Scores:        written to', self.filename
+        print 'Win Rate:      %d/%d (%.2f)' % (self.wins, self.numGames, self.getWinRate())
+        if self.file == None:
+            print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in self.record])
+        else:
+            print 'Record:        written to', self.filename
+
+def recordGame( layout, actions, i ):
+    import time, cPickle
+    fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+    f = file(fname, 'w')
+    components = {'layout': layout, 'actions': actions}
+    cPickle.dump(components, f)
+    f.close()
+
+# What each worker process of runParallelGames() plays with: the layout,
+# agents and rules, built once per worker by initWorker()
+_worker = {}
+
+def initWorker( agentSpec, catchExceptions, timeout, fast ):
+    """
+    Builds the layout and agents of a worker process from the same
+    command line arguments that readCommand() used.
+    """
+    GameState.setExploredTracking(agentSpec['explored'], agentSpec['exploredLimit'])
+    _worker['layout'] = layout.getLayout( agentSpec['layout'] )
+    pacmanType = loadAgent(agentSpec['pacman'], True)
+    _worker['pacman'] = pacmanType(**agentSpec['agentOpts'])
+    ghostType = loadAgent(agentSpec['ghost'], True)
+    _worker['ghosts'] = [ghostType( i+1, **agentSpec['ghostOpts'] ) for i in range( agentSpec['numGhosts'] )]
+    _worker['rules'] = ClassicGameRules(timeout)
+    _worker['rules'].quiet = True
+    _worker['catchExceptions'] = catchExceptions
+    _worker['fast'] = fast
+
+def playSeededGame( task ):
+    """
+    Plays game number i of a parallel run in a worker process, and returns
+    a small record of the result rather than the game itself.
+    """
+    i, seed, record = task
+    import textDisplay
+    random.seed(seed)
+    game = _worker['rules'].newGame( _worker['layout'], _worker['pacman'], _worker['ghosts'],
+                                     textDisplay.NullGraphics(), True, _worker['catchExceptions'] )
+    if _worker['fast']: game.runFast()
+    else: game.run()
+    result = gameRecord(game, i, seed)
+    if record: result['actions'] = game.moveHistory
+    return result
+
+def runParallelGames( layout, agentSpec, workers, baseSeed, numGames, record, numTraining = 0,
+                      catchExceptions=False, timeout=30, results=None, fast=False, recordLog=None,
+                      snapshotInterval=0 ):
+    """
+    Plays the games of runGames() in a pool of worker processes.
+
+    Game i is seeded with baseSeed + i, so it plays out the same whichever
+    worker it lands on. Results come back as each game finishes, but are
+    reported in game order, so the output does not depend on the number of
+    workers. Training games are played too, but each worker trains its own
+    copy of the agent.
+
+    Returns the GameResults of the non-training games.
+    """
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, initWorker, (agentSpec, catchExceptions, timeout, fast))
+    tasks = ((i, baseSeed + i, record or recordLog != None) for i in xrange(numGames))
+    finished = {}
+    summary = GameResults(results)
+    if recordLog != None:
+        import gameLog
+        log = gameLog.GameLogWriter(recordLog, snapshotInterval)
+        numAgents = 1 + min(layout.getNumGhosts(), agentSpec['numGhosts'])
+    nextGame = 0
+    try:
+        for result in pool.imap_unordered(playSeededGame, tasks):
+            finished[result['game']] = result
+            # Report every game that is now complete up to the first gap
+            while nextGame in finished:
+                result = finished.pop(nextGame)
+                actions = result.pop('actions', None)
+                if record: recordGame( layout, actions, nextGame )
+                if recordLog != None: log.addGame( layout, actions, numAgents, result['seed'] )
+                if nextGame >= numTraining:
+                    if result['win']:
+                        print "Pacman emerges victorious! Score: %d" % result['score']
+                    else:
+                        print "Pacman died! Score: %d" % result['score']
+                    summary.add(result)
+                nextGame += 1
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        summary.close()
+        if recordLog != None: log.close()
 
     if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print 'Average Score:', sum(scores) / float(len(scores))
-        print 'Scores:       ', ', '.join([str(score) for score in scores])
-        print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
-        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
-
-    return games
+        summary.printSummary()
+
+    return summary
 
 if __name__ == '__main__':
     """
@@ -0,0 +1,93 @@
+# transitionModel.py
+#
+# A precomputed transition model for the MDP agents.
+#
+# The motion model is the one from the MDP lecture: Pacman moves in the
+# intended direction with probability 0.8, and in each of the two
+# perpendicular directions with probability 0.1. A move into a wall
+# leaves Pacman where it is.
+#
+# The model only depends on where the walls are, so it is built once per
+# layout and then shared by every game played on that layout.
+
+import api
+
+# Probabilities of the intended and of each perpendicular move
+INTENDED = 0.8
+SIDE = 0.1
+
+# Actions are indexed in this order. Anything else is treated as West,
+# as in the original expectedUtility() code.
+ACTIONS = ["North", "East", "South", "West"]
+ACTION_INDEX = {"North": 0, "East": 1, "South": 2, "West": 3}
+
+# For each action, the intended move and the two perpendicular moves,
+# in the order the original expectedUtility() added them up.
+MOVES = [(0, 1, 3), (1, 0, 2), (2, 1, 3), (3, 0, 2)]
+
+# Models that have already been built, keyed on the layout text
+MODEL_CACHE = {}
+
+def getTransitionModel(state):
+    # Returns the transition model for the layout of state, building it
+    # the first time the layout is seen.
+    key = str(state.data.layout)
+    if key not in MODEL_CACHE:
+        MODEL_CACHE[key] = TransitionModel(api.walls(state), api.corners(state))
+    return MODEL_CACHE[key]
+
+#
+# The model is stored in CSR (compressed sparse row) form. There is one
+# row for every (state, action) pair, row number 4 * state + action, and
+# the entries of row r are:
+#
+# indices[indptr[r]:indptr[r + 1]]  the states it can lead to
+# data[indptr[r]:indptr[r + 1]]     the probability of each of them
+#
+# where states are numbered by their position in cells. Rows are not
+# merged when two moves lead to the same state (as happens next to a
+# wall), so expected utilities are summed in exactly the same order as
+# the original dictionary code and come out identical.
+#
+class TransitionModel:
+
+    def __init__(self, walls, corners):
+        self.walls = set(walls)
+        self.width = max([c[0] for c in corners]) + 1
+        self.height = max([c[1] for c in corners]) + 1
+
+        # Non-wall locations, and the number of each of them
+        self.cells = []
+        for i in range(self.width):
+            for j in range(self.height):
+                if (i, j) not in self.walls:
+                    self.cells.append((i, j))
+        self.index = dict((cell, i) for i, cell in enumerate(self.cells))
+
+        self.indptr = [0]
+        self.indices = []
+        self.data = []
+        for i, (x, y) in enumerate(self.cells):
+            # Where each of N, E, S, W ends up from here
+            reached = [self.index.get(loc, i) for loc in
+                       [(x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y)]]
+            for intended, firstSide, secondSide in MOVES:
+                self.indices.extend([reached[intended], reached[firstSide], reached[secondSide]])
+                self.data.extend([INTENDED, SIDE, SIDE])
+                self.indptr.append(len(self.indices))
+
+    # Returns the list of (next state, probability) pairs for taking
+    # the action numbered a in the state numbered s.
+    def successors(self, s, a):
+        start = self.indptr[4 * s + a]
+        end = self.indptr[4 * s + a + 1]
+        return zip(self.indices[start:end], self.data[start:end])
+
+    # Expected utility of taking action at location, where values is a
+    # dictionary from location to utility.
+    def expectedUtility(self, values, location, action):
+        row = 4 * self.index[location] + ACTION_INDEX.get(action, 3)
+        utility = 0
+        for k in range(self.indptr[row], self.indptr[row + 1]):
+            utility += self.data[k] * values[self.cells[self.indices[k]]]
+        return utility
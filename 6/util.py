@@ -615,6 +615,10 @@ class TimeoutFunctionException(Exception):
 
 
 class TimeoutFunction:
+    """
+    Calls function, raising TimeoutFunctionException if it takes more than
+    timeout seconds.  The timeout can be a fraction of a second.
+    """
     def __init__(self, function, timeout):
         self.timeout = timeout
         self.function = function
@@ -623,17 +627,35 @@ class TimeoutFunction:
         raise TimeoutFunctionException()
 
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
-            old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
+        # No time left at all
+        if self.timeout <= 0:
+            self.handle_timeout(None, None)
+
+        # If we have SIGALRM signal, use an interval timer to cause an
+        # exception if and when this function runs too long.  Signals can
+        # only be handled in the main thread, so elsewhere (or without
+        # SIGALRM) check the time taken after the method has returned, and
+        # throw an exception then.
+        useSignal = hasattr(signal, 'SIGALRM')
+        if useSignal:
+            try:
+                old = signal.signal(signal.SIGALRM, self.handle_timeout)
+            except ValueError:
+                useSignal = False
+
+        if useSignal:
+            startTime = time.time()
+            outer, interval = signal.setitimer(signal.ITIMER_REAL, self.timeout)
             try:
                 result = self.function(*args, **keyArgs)
             finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
                 signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
+                # Put back any timer that was already running, less the
+                # time spent here
+                if outer > 0:
+                    remaining = outer - (time.time() - startTime)
+                    signal.setitimer(signal.ITIMER_REAL, max(remaining, 0.001), interval)
         else:
             startTime = time.time()
             result = self.function(*args, **keyArgs)